@@ -0,0 +1,125 @@
+"""
+Адаптивный регулятор размера батча и числа рабочих по запасу ресурсов
+"""
+
+from collections import deque
+from typing import Dict, Optional, Sequence, Tuple
+
+
+def quantize_batch(batch_size: int, workers: int, b_min: int = 0) -> int:
+    """Размер батча, кратный числу рабочих (не меньше workers и b_min): равные доли без хвоста"""
+    workers = max(1, workers)
+    quantized = max(workers, batch_size - batch_size % workers)
+    if quantized < b_min:
+        quantized += -(-(b_min - quantized) // workers) * workers
+    return quantized
+
+
+class AdaptiveController:
+    """Регулятор (батч, рабочие) с EWMA-сглаживанием нагрузки
+    
+    Рост пропорционален запасу ресурса, сжатие при подходе к лимиту - мультипликативное.
+    """
+    
+    # Ширина зоны (в процентах) под лимитом, в которой запас убывает от 1 до 0
+    MEMORY_HEADROOM_SPAN = 25.0
+    CPU_HEADROOM_SPAN = 40.0
+    CPU_CAP_PERCENT = 90.0
+    
+    # Запас свободной памяти в GB: ниже MIN - критично, выше MIN + SPAN - свободно
+    MIN_AVAILABLE_GB = 0.5
+    AVAILABLE_GB_SPAN = 1.5
+    
+    def __init__(self, b_min: int, b_max: int, k_min: int, k_max: int,
+                 eta: float = 0.85, gamma: float = 0.7,
+                 lambda_b: float = 0.2, lambda_k: float = 0.2,
+                 alpha: float = 0.3, target_time: float = 7.5, tau: float = 3.0):
+        self.b_min = b_min
+        self.b_max = b_max
+        self.k_min = k_min
+        self.k_max = k_max
+        self.eta = eta                  # Доля памяти, выше которой - сжатие
+        self.gamma = gamma              # Множитель сжатия
+        self.lambda_b = lambda_b        # Скорость роста батча
+        self.lambda_k = lambda_k        # Скорость роста числа рабочих
+        self.alpha = alpha              # Вес нового значения в EWMA
+        self.target_time = target_time  # Целевое время батча (секунды)
+        self.tau = tau                  # Порог хвоста задержек p95/p50
+        
+        self.memory_percent: Optional[float] = None
+        self.cpu_percent: Optional[float] = None
+        # Неблокирующие замеры CPU по батчам; сглаживается их p95, а не единичный замер
+        self.cpu_samples = deque(maxlen=20)
+    
+    def _smooth(self, previous: Optional[float], value: float) -> float:
+        """Экспоненциальное сглаживание"""
+        if previous is None:
+            return value
+        return previous + self.alpha * (value - previous)
+    
+    @staticmethod
+    def _clamp(value: float, low: float = 0.0, high: float = 1.0) -> float:
+        """Ограничить значение диапазоном"""
+        return min(high, max(low, value))
+    
+    def memory_headroom(self, available_gb: float = None) -> float:
+        """Запас памяти в [0, 1] по сглаженной загрузке"""
+        cap = self.eta * 100
+        headroom = (cap - self.memory_percent) / self.MEMORY_HEADROOM_SPAN
+        if available_gb is not None:
+            headroom = min(headroom, (available_gb - self.MIN_AVAILABLE_GB) / self.AVAILABLE_GB_SPAN)
+        return self._clamp(headroom)
+    
+    def cpu_headroom(self) -> float:
+        """Запас CPU в [0, 1] по сглаженной загрузке"""
+        return self._clamp((self.CPU_CAP_PERCENT - self.cpu_percent) / self.CPU_HEADROOM_SPAN)
+    
+    @staticmethod
+    def latency_quantiles(samples: Sequence[float]) -> Tuple[float, float]:
+        """p50 и p95 по последним замерам (время батча, загрузка CPU)"""
+        if not samples:
+            return 0.0, 0.0
+        ordered = sorted(samples)
+        last = len(ordered) - 1
+        return ordered[last // 2], ordered[int(last * 0.95)]
+    
+    def propose(self, metrics: Dict[str, float], batch_size: int, workers: int) -> Tuple[int, int]:
+        """Новые размер батча и число рабочих по метрикам последнего батча
+        
+        metrics: memory_percent, available_gb, cpu_percent, batch_time, record_time_p50, record_time_p95
+        (квантили времени на одну запись - не зависят от размера батча)
+        """
+        memory_percent = metrics['memory_percent']
+        cpu_percent = metrics.get('cpu_percent', 0.0)
+        available_gb = metrics.get('available_gb')
+        batch_time = metrics.get('batch_time', 0.0)
+        
+        self.cpu_samples.append(cpu_percent)
+        _, cpu_p95 = self.latency_quantiles(self.cpu_samples)
+        self.memory_percent = self._smooth(self.memory_percent, memory_percent)
+        self.cpu_percent = self._smooth(self.cpu_percent, cpu_p95)
+        h_mem = self.memory_headroom(available_gb)
+        h_cpu = self.cpu_headroom()
+        
+        # Пик памяти или тяжелый хвост задержек сжимают сразу, не дожидаясь сглаженного значения
+        p50 = metrics.get('record_time_p50', 0.0)
+        p95 = metrics.get('record_time_p95', 0.0)
+        tail_spike = p50 > 0 and p95 / p50 > self.tau
+        near_cap = memory_percent >= self.eta * 100 or h_mem == 0 or tail_spike
+        
+        if near_cap:
+            batch_size = int(batch_size * self.gamma)
+        elif batch_time > self.target_time:
+            # Батч медленнее цели - сжимаемся пропорционально, но не сильнее gamma
+            batch_size = int(batch_size * max(self.gamma, self.target_time / batch_time))
+        else:
+            batch_size = int(batch_size + self.lambda_b * h_mem * (self.b_max - batch_size))
+        
+        if near_cap or cpu_percent >= self.CPU_CAP_PERCENT:
+            workers = int(workers * self.gamma)
+        else:
+            workers = round(workers + self.lambda_k * h_cpu * (self.k_max - workers))
+        
+        batch_size = int(self._clamp(batch_size, self.b_min, self.b_max))
+        workers = int(self._clamp(workers, self.k_min, self.k_max))
+        return quantize_batch(batch_size, workers, self.b_min), workers
@@ -4,6 +4,7 @@
 
 import os
 import json
+import mmap
 import time
 import shutil
 import hashlib
@@ -13,6 +14,12 @@ from dataclasses import dataclass, asdict, field, fields, is_dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
 # Используем относительные импорты
 from .config import Config
 
@@ -41,6 +48,12 @@ class CheckpointState:
     unique_devices: List[str] = field(default_factory=list)
     unique_companies: List[str] = field(default_factory=list)
     unique_ips: List[str] = field(default_factory=list)
+    # Описание бинарного файла с хэшами (path, size, crc)
+    hashes_sidecar: Dict[str, Any] = field(default_factory=dict)
+    # Описание журнала дельт уникальных значений (path, size)
+    uniques_wal: Dict[str, Any] = field(default_factory=dict)
+    # Описание накопительного файла записей (path, size)
+    records_file: Dict[str, Any] = field(default_factory=dict)
     
     def __post_init__(self):
         """Инициализация после создания объекта"""
@@ -183,6 +196,8 @@ class CheckpointManager:
         self.checkpoint_temp = f"{self.checkpoint_file}.tmp"
         self.checkpoint_backup = f"{self.checkpoint_file}.backup"
         self.checkpoint_archive = f"{self.checkpoint_file}.archive"
+        self.hashes_file = f"{self.checkpoint_file}.hashes.bin"
+        self.uniques_wal_file = f"{self.checkpoint_file}.uniques.wal"
         
         self.state: Optional[CheckpointState] = None
         self.last_save = 0.0
@@ -313,14 +328,56 @@ class CheckpointManager:
             self.stats['integrity_errors'] += 1
             return False
     
+    def _serialize_checkpoint(self, checkpoint_data: Dict[str, Any]) -> bytes:
+        """Сериализация чекпоинта сразу в bytes (без промежуточной строки при наличии orjson)"""
+        if _HAS_ORJSON:
+            return orjson.dumps(checkpoint_data, default=str)
+        return json.dumps(checkpoint_data, ensure_ascii=False, default=str).encode('utf-8')
+    
+    def _write_file_mmap(self, filepath: str, payload: bytes):
+        """Запись через заранее выделенный файл и mmap вместо буферизованного write()"""
+        size = len(payload)
+        fd = os.open(filepath, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            if size == 0:
+                return
+            
+            # Выделяем место под весь файл сразу, без роста по мере записи
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+            
+            with mmap.mmap(fd, size) as mm:
+                mm[:] = payload
+                mm.flush()
+        finally:
+            os.close(fd)
+    
+    @staticmethod
+    def _read_json_mmap(filepath: str) -> Any:
+        """Чтение JSON через mmap: orjson разбирает страницы файла без копирования в строку"""
+        if not _HAS_ORJSON:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        
+        fd = os.open(filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            if os.fstat(fd).st_size == 0:
+                raise json.JSONDecodeError("Пустой файл", "", 0)
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+        finally:
+            os.close(fd)
+    
     def _safe_json_load(self, filepath: str) -> Optional[Dict[str, Any]]:
         """Безопасная загрузка JSON с обработкой ошибок"""
         if not os.path.exists(filepath):
             return None
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self._read_json_mmap(filepath)
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON в файле {filepath}: {e}")
             
@@ -517,7 +574,10 @@ class CheckpointManager:
                        unique_users: list,
                        unique_devices: list,
                        unique_companies: list,
-                       unique_ips: list) -> bool:
+                       unique_ips: list,
+                       hashes_sidecar: Optional[Dict[str, Any]] = None,
+                       uniques_wal: Optional[Dict[str, Any]] = None,
+                       records_file: Optional[Dict[str, Any]] = None) -> bool:
         """
         Сохранить состояние чекпоинта
         
@@ -565,6 +625,9 @@ class CheckpointManager:
             'unique_devices': unique_devices,
             'unique_companies': unique_companies,
             'unique_ips': unique_ips,
+            'hashes_sidecar': hashes_sidecar or {},
+            'uniques_wal': uniques_wal or {},
+            'records_file': records_file or {},
         }
         
         # Добавляем контрольную сумму
@@ -573,8 +636,7 @@ class CheckpointManager:
         
         try:
             # Шаг 1: Сохраняем во временный файл
-            with open(self.checkpoint_temp, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint_data, f, indent=2, ensure_ascii=False, default=str)
+            self._write_file_mmap(self.checkpoint_temp, self._serialize_checkpoint(checkpoint_data))
             
             # Шаг 2: Создаем резервную копию текущего чекпоинта (если есть)
             if os.path.exists(self.checkpoint_file):
@@ -592,15 +654,8 @@ class CheckpointManager:
                 except Exception as e:
                     logger.warning(f"Не удалось создать резервную копию: {e}")
             
-            # Шаг 3: Атомарно перемещаем временный файл в основной
-            self._atomic_save(self.checkpoint_temp, self.checkpoint_file)
-            
-            # Шаг 4: Очищаем временный файл
-            if os.path.exists(self.checkpoint_temp):
-                try:
-                    os.remove(self.checkpoint_temp)
-                except Exception:
-                    pass
+            # Шаг 3: Атомарно переименовываем временный файл в основной (в том же каталоге, без копии)
+            os.replace(self.checkpoint_temp, self.checkpoint_file)
             
             # Обновляем состояние
             self.state = CheckpointState.from_dict(checkpoint_data)
@@ -642,7 +697,9 @@ class CheckpointManager:
             self.checkpoint_file,
             self.checkpoint_backup,
             self.checkpoint_temp,
-            self.checkpoint_archive
+            self.checkpoint_archive,
+            self.hashes_file,
+            self.uniques_wal_file
         ]
         
         removed_count = 0
@@ -686,14 +743,14 @@ class CheckpointManager:
         info["save_count"] = self.save_count
         info["checksum"] = self.checksum
         
-        # Добавляем информацию о файлах
-        if os.path.exists(self.checkpoint_file):
-            try:
-                info["file_size"] = os.path.getsize(self.checkpoint_file)
-                info["file_mtime"] = os.path.getmtime(self.checkpoint_file)
-                info["file_ctime"] = os.path.getctime(self.checkpoint_file)
-            except Exception:
-                pass
+        # Добавляем информацию о файлах (один stat - согласованный снимок)
+        try:
+            st = os.stat(self.checkpoint_file)
+            info["file_size"] = st.st_size
+            info["file_mtime"] = st.st_mtime
+            info["file_ctime"] = st.st_ctime
+        except OSError:
+            pass
         
         return info
     
@@ -816,12 +873,12 @@ class CheckpointManager:
         stats['backup_exists'] = os.path.exists(self.checkpoint_backup)
         stats['archive_exists'] = os.path.exists(self.checkpoint_archive)
         
-        if os.path.exists(self.checkpoint_file):
-            try:
-                stats['checkpoint_size'] = os.path.getsize(self.checkpoint_file)
-                stats['checkpoint_mtime'] = os.path.getmtime(self.checkpoint_file)
-            except Exception:
-                pass
+        try:
+            st = os.stat(self.checkpoint_file)
+            stats['checkpoint_size'] = st.st_size
+            stats['checkpoint_mtime'] = st.st_mtime
+        except OSError:
+            pass
         
         # Добавляем информацию о текущем состоянии
         if self.state:
@@ -896,8 +953,7 @@ class CheckpointUtils:
     def _safe_read_json(filepath: str) -> Optional[Dict[str, Any]]:
         """Безопасное чтение JSON файла"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return CheckpointManager._read_json_mmap(filepath)
         except Exception:
             return None
     
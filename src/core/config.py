@@ -3,6 +3,7 @@
 """
 
 import os
+import functools
 import psutil
 import platform
 from datetime import datetime
@@ -136,15 +137,23 @@ class Config:
             return {'total': 0, 'used': 0, 'free': 0, 'percent': 0}
     
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def get_input_dir(cls):
-        """Получить путь к папке с входными данными"""
+        """Получить путь к папке с входными данными (кэшируется, см. invalidate_paths)"""
         return os.path.join(cls.BASE_DIR, cls.INPUT_FOLDER)
     
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def get_output_dir(cls):
-        """Получить путь к папке для результатов"""
+        """Получить путь к папке для результатов (кэшируется, см. invalidate_paths)"""
         return os.path.join(cls.BASE_DIR, cls.OUTPUT_FOLDER)
     
+    @classmethod
+    def invalidate_paths(cls):
+        """Сбросить кэш путей после изменения BASE_DIR / INPUT_FOLDER / OUTPUT_FOLDER"""
+        cls.get_input_dir.cache_clear()
+        cls.get_output_dir.cache_clear()
+    
     @classmethod
     def get_output_subdir(cls, timestamp: str = None):
         """Получить путь к подпапке с результатами"""
@@ -171,14 +180,17 @@ class Config:
         return output_path
     
     @classmethod
-    def ensure_base_directories(cls):
-        """Создание базовых директорий проекта"""
-        base_folders = [
+    def get_base_directories(cls):
+        """Базовые директории проекта"""
+        return [
             cls.get_input_dir(),
             cls.get_output_dir()
         ]
-        
-        for folder in base_folders:
+    
+    @classmethod
+    def ensure_base_directories(cls):
+        """Создание базовых директорий проекта"""
+        for folder in cls.get_base_directories():
             os.makedirs(folder, exist_ok=True)
     
     @classmethod
@@ -227,7 +239,7 @@ class Config:
         try:
             # Получаем текущую нагрузку
             memory_percent = cls.get_memory_usage_percent()
-            cpu_percent = psutil.cpu_percent(interval=0.1)
+            cpu_percent = psutil.cpu_percent(interval=None)
             
             # Корректируем размер батча на основе нагрузки
             if memory_percent > 80 or cpu_percent > 80:
@@ -8,7 +8,7 @@ import hashlib
 import time
 import functools
 import logging
-from typing import Optional, Dict, Tuple, List, Any, Callable, Union
+from typing import Optional, Dict, Tuple, List, Any, Callable, Union, Iterator
 from collections import defaultdict, OrderedDict
 from dataclasses import dataclass, field
 from contextlib import contextmanager
@@ -903,6 +903,61 @@ def is_valid_json_line(line: str) -> bool:
     return FieldExtractor.is_valid_json_line(line)
 
 
+def _iter_text_lines(text: str) -> Iterator[str]:
+    """Строки текста с '\n' на конце - срезы по мере чтения, без второй копии текста
+    
+    io.StringIO хранил бы копию в UCS-4 (до 4x размера ASCII-текста), splitlines -
+    список всех строк сразу и другие разделители (\x0b, \u2028 ...), чем у файла.
+    """
+    # Правила текстового файла с newline=None: \r\n и одиночный \r - тоже конец строки.
+    # Разделитель заменяется в каждом срезе, а не во всем тексте - без полноразмерной копии
+    has_cr = '\r' in text
+    find = text.find
+    start = 0
+    end = len(text)
+    newline = find('\n')
+    while start < end:
+        # Позиция '\n' ищется заново только после того, как строки дошли до нее
+        if start > newline != -1:
+            newline = find('\n', start)
+        if has_cr:
+            carriage = find('\r', start, end if newline == -1 else newline)
+            if carriage != -1:
+                yield text[start:carriage] + '\n'
+                start = carriage + 2 if carriage + 1 == newline else carriage + 1
+                continue
+        if newline == -1:
+            yield text[start:]
+            return
+        yield text[start:newline + 1]
+        start = newline + 1
+
+
+@contextmanager
+def open_input_lines(input_file: str, start_position: int = 0, backend: str = 'stream',
+                     buffer_size: int = 1024 * 1024 * 10, errors: str = 'ignore'):
+    """
+    Источник строк входного файла начиная с байтовой позиции
+    
+    backend='inmem' - файл читается одним вызовом и разбирается в памяти,
+    backend='stream' - построчное буферизованное чтение с низким RSS
+    """
+    if backend == 'inmem':
+        with open(input_file, 'rb') as f:
+            if start_position > 0:
+                f.seek(start_position)
+            data = f.read()
+        text = data.decode('utf-8', errors=errors)
+        del data
+        yield _iter_text_lines(text)
+        return
+    
+    with open(input_file, 'r', encoding='utf-8', buffering=buffer_size, errors=errors) as f:
+        if start_position > 0:
+            f.seek(start_position)
+        yield f
+
+
 @contextmanager
 def parser_context(config: Optional[ParserConfig] = None):
     """
@@ -12,18 +12,25 @@ import traceback
 import json
 from typing import List, Tuple, Set, Dict, Any, Optional, Deque
 from collections import deque
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import psutil
 import tracemalloc
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
 # Локальные импорты - исправлены на относительные
 from .config import Config
 from .models import ProcessingMetrics, FaceRecord
-from .data_parser import parse_batch_records, get_global_parser
+from .data_parser import parse_batch_records, get_global_parser, open_input_lines
 from .checkpoint_manager import CheckpointManager
-from processing.image_processor import ImageProcessorWithEmbedding, process_images_batch, process_images_batch_simple
+from processing.image_processor import (ImageProcessorWithEmbedding, ResizableSemaphore,
+                                        process_images_batch, process_images_batch_simple)
 from processing.report_generator import ReportGenerator
 from utils.logger import setup_logger
 from utils.memory_monitor import MemoryMonitor
@@ -261,10 +268,8 @@ class BatchProcessor:
                                 record.image_size_kb = img_info.get('file_size_kb', 0)
                                 record.download_time_ms = img_info.get('download_time_ms', 0)
                                 record.is_cached = img_info.get('is_cached', False)
-                            record.image_hash = hashlib.md5(record.image_url.encode()).hexdigest()
                         elif record.image_url:
                             record.failed_reason = img_info.get('failed_reason', 'Ошибка загрузки') if img_info else 'Ошибка загрузки'
-                            record.image_hash = hashlib.md5(record.image_url.encode()).hexdigest()
                 
                 face_records.append(record)
                 
@@ -418,13 +423,19 @@ class OptimizedFaceRecognitionProcessor:
     - Поддержка возобновления обработки
     """
     
-    def __init__(self, formats: List[str], resume: bool = False):
+    def __init__(self, formats: List[str], resume: bool = False,
+                 executor: Optional[ProcessPoolExecutor] = None, backend: str = 'stream',
+                 semaphore: Optional[ResizableSemaphore] = None, executor_workers: Optional[int] = None):
         self.metrics = ProcessingMetrics()
         self.records: List[FaceRecord] = []
         self.image_processor = None
+        self.executor = executor  # Внешний пул процессов для обработки изображений
+        self.executor_workers = executor_workers  # Число процессов внешнего пула
         self.formats = formats
         self.output_dir = ""
         self.resume = resume
+        self.backend = backend  # 'inmem' - файл читается целиком, 'stream' - построчно
+        self.semaphore = semaphore  # Общий лимит одновременных загрузок (None - лимит обработчика изображений)
         
         # Динамические настройки
         self.batch_size = Config.INITIAL_BATCH_SIZE
@@ -445,6 +456,7 @@ class OptimizedFaceRecognitionProcessor:
         # Блокировки
         self.metrics_lock = asyncio.Lock()
         self.records_lock = asyncio.Lock()
+        self._records_file: Optional[str] = None  # Записи пишутся на диск по мере обработки
         
         logger.info(f"Инициализирован OptimizedFaceRecognitionProcessor с batch_size={self.batch_size}")
     
@@ -498,7 +510,9 @@ class OptimizedFaceRecognitionProcessor:
         
         # Инициализация процессора изображений
         print("🚀 Инициализация обработчика изображений...")
-        self.image_processor = ImageProcessorWithEmbedding(self.output_dir)
+        self.image_processor = ImageProcessorWithEmbedding(self.output_dir, executor=self.executor,
+                                                           semaphore=self.semaphore,
+                                                           executor_workers=self.executor_workers)
         
         # Инициализация батч-процессора
         self.batch_processor = BatchProcessor(self.image_processor, self.metrics)
@@ -558,13 +572,12 @@ class OptimizedFaceRecognitionProcessor:
             # Чтение файла с буферизацией
             buffer_size = 1024 * 1024 * 20  # 20MB буфер
             
-            with open(input_file, 'r', encoding='utf-8', buffering=buffer_size) as f:
-                # Определяем начальную позицию
-                start_position = await self._get_start_position()
-                if start_position > 0:
-                    f.seek(start_position)
-                    logger.info(f"Продолжаем с позиции: {start_position:,} байт")
-                
+            # Определяем начальную позицию
+            start_position = await self._get_start_position()
+            if start_position > 0:
+                logger.info(f"Продолжаем с позиции: {start_position:,} байт")
+            
+            with open_input_lines(input_file, start_position, self.backend, buffer_size, errors='strict') as f:
                 batch_data = []
                 batch_count = 0
                 current_position = start_position
@@ -647,9 +660,9 @@ class OptimizedFaceRecognitionProcessor:
             self.metrics.total_records += processed_in_batch
             self.metrics.processed_records += len(batch_records)
         
-        # Добавление записей в общий список
-        async with self.records_lock:
-            self.records.extend(batch_records)
+        # Записи сразу уходят на диск и не копятся в памяти до конца обработки
+        await self._append_batch_jsonl(batch_records)
+        batch_records.clear()
         
         # Обновление прогресса
         if self.metrics.processed_records % 1000 == 0:
@@ -677,48 +690,12 @@ class OptimizedFaceRecognitionProcessor:
                 parser.clear_cache()
                 logger.debug(f"Очищен кэш парсера")
             
-            # Промежуточное сохранение записей если их много
-            if len(self.records) > 10000:
-                await self._save_records_intermediate()
-            
             # Принудительный сбор мусора
             gc.collect()
             
         except Exception as e:
             logger.debug(f"Ошибка оптимизации памяти: {e}")
     
-    async def _save_records_intermediate(self):
-        """Промежуточное сохранение записей для экономии памяти"""
-        try:
-            if len(self.records) < 5000:
-                return
-            
-            # Сохраняем половину записей
-            save_count = len(self.records) // 2
-            records_to_save = self.records[:save_count]
-            
-            temp_file = os.path.join(
-                self.output_dir,
-                Config.TEMP_FOLDER,
-                f"records_temp_{int(time.time())}.jsonl"
-            )
-            
-            os.makedirs(os.path.dirname(temp_file), exist_ok=True)
-            
-            # Быстрая сериализация
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                for record in records_to_save:
-                    f.write(json.dumps(record.to_dict()) + '\n')
-            
-            # Удаляем сохраненные записи
-            async with self.records_lock:
-                del self.records[:save_count]
-            
-            logger.debug(f"Сохранено {save_count} записей во временный файл")
-            
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении записей: {e}")
-    
     async def _display_progress(self):
         """Отображение прогресса обработки"""
         last_update = 0
@@ -787,19 +764,26 @@ class OptimizedFaceRecognitionProcessor:
         """Генерация выбранных отчетов"""
         reports_created = []
         
-        # Загрузка сохраненных записей если есть
-        await self._load_saved_records()
-        
         # Генерация HTML отчета
         if "HTML" in self.formats:
             print("🔄 Создание HTML отчета...")
             try:
+                # Записи читаются с диска только здесь, когда отчету нужны все сразу
+                self.records = self.load_all_completed_samples()
                 html_report = self.report_generator.generate_html_report(self.records, self.metrics)
                 if html_report:
                     reports_created.append(("🌐 HTML отчет", html_report))
                     print("✅ HTML отчет создан")
             except Exception as e:
                 print(f"❌ Ошибка создания HTML отчета: {e}")
+            finally:
+                self.records = []
+        
+        # Удаляем временный файл записей
+        try:
+            os.remove(self._records_stream_file())
+        except OSError:
+            pass
         
         # Создание README файла
         self._create_readme(reports_created)
@@ -852,45 +836,55 @@ class OptimizedFaceRecognitionProcessor:
         except Exception as e:
             logger.error(f"Ошибка создания README файла: {e}")
     
-    async def _load_saved_records(self):
-        """Загрузка сохраненных записей из временных файлов"""
-        temp_dir = os.path.join(self.output_dir, Config.TEMP_FOLDER)
-        if not os.path.exists(temp_dir):
-            return
+    def _records_stream_file(self) -> str:
+        """Путь к накопительному JSONL файлу записей"""
+        if self._records_file is None:
+            temp_dir = os.path.join(self.output_dir, Config.TEMP_FOLDER)
+            os.makedirs(temp_dir, exist_ok=True)
+            self._records_file = os.path.join(temp_dir, "records.jsonl")
+        return self._records_file
+    
+    async def _append_batch_jsonl(self, batch_records: List[FaceRecord]):
+        """Дописать записи батча в накопительный JSONL файл"""
+        try:
+            # Все поля dataclass (включая image_base64), чтобы запись
+            # восстанавливалась через FaceRecord(**data)
+            with open(self._records_stream_file(), 'ab') as f:
+                for record in batch_records:
+                    try:
+                        if _HAS_ORJSON:
+                            f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+                        else:
+                            f.write((json.dumps(asdict(record), ensure_ascii=False) + '\n').encode('utf-8', errors='ignore'))
+                    except Exception as e:
+                        logger.debug(f"Ошибка сериализации записи: {e}")
+                        continue
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении записей: {e}")
+    
+    def load_all_completed_samples(self) -> List[FaceRecord]:
+        """Загрузить все обработанные записи с диска (только для генерации отчетов)"""
+        records_file = self._records_stream_file()
+        records = []
+        if not os.path.exists(records_file):
+            return records
         
         try:
-            temp_files = []
-            for filename in os.listdir(temp_dir):
-                if filename.startswith('records_temp_') and filename.endswith('.jsonl'):
-                    filepath = os.path.join(temp_dir, filename)
-                    temp_files.append((os.path.getmtime(filepath), filepath))
-            
-            # Сортируем по времени создания
-            temp_files.sort()
-            
-            loaded_count = 0
-            for _, filepath in temp_files:
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            if line.strip():
-                                data = json.loads(line.strip())
-                                record = FaceRecord(**data)
-                                async with self.records_lock:
-                                    self.records.append(record)
-                                loaded_count += 1
-                    
-                    # Удаляем временный файл
-                    os.remove(filepath)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка загрузки файла {filepath}: {e}")
+            with open(records_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            data = orjson.loads(line) if _HAS_ORJSON else json.loads(line)
+                            records.append(FaceRecord(**data))
+                        except (ValueError, TypeError) as e:
+                            logger.debug(f"Ошибка парсинга записи: {e}")
+                            continue
             
-            if loaded_count > 0:
-                logger.info(f"Загружено {loaded_count} записей из временных файлов")
-                
-        except Exception as e:
-            logger.error(f"Ошибка загрузки сохраненных записей: {e}")
+            logger.info(f"Загружено {len(records)} записей из {os.path.basename(records_file)}")
+        except OSError as e:
+            logger.error(f"Ошибка загрузки файла {records_file}: {e}")
+        
+        return records
     
     async def _load_checkpoint_state(self, input_file: str, total_lines: int) -> Tuple[int, Dict[str, Any]]:
         """Загрузить состояние чекпоинта"""
@@ -999,9 +993,11 @@ class OptimizedFaceRecognitionProcessor:
     def _adjust_batch_size_dynamically(self, batch_count: int):
         """Динамическая настройка размера батча"""
         try:
-            memory_percent = psutil.virtual_memory().percent
-            available_gb = psutil.virtual_memory().available / (1024**3)
-            cpu_percent = psutil.cpu_percent(interval=0.1)
+            mem = psutil.virtual_memory()
+            memory_percent = mem.percent
+            available_gb = mem.available / (1024**3)
+            # Загрузка с прошлого батча без блокировки цикла событий
+            cpu_percent = psutil.cpu_percent(interval=None)
             
             new_batch_size = self.batch_size
             
@@ -1099,6 +1095,10 @@ class OptimizedFaceRecognitionProcessor:
         }
 
 
-def get_optimized_processor(formats: List[str], resume: bool = False) -> OptimizedFaceRecognitionProcessor:
+def get_optimized_processor(formats: List[str], resume: bool = False,
+                            executor: Optional[ProcessPoolExecutor] = None,
+                            backend: str = 'stream',
+                            semaphore: Optional[ResizableSemaphore] = None,
+                            executor_workers: Optional[int] = None) -> OptimizedFaceRecognitionProcessor:
     """Фабрика для создания оптимизированного процессора"""
-    return OptimizedFaceRecognitionProcessor(formats, resume)
\ No newline at end of file
+    return OptimizedFaceRecognitionProcessor(formats, resume, executor, backend, semaphore, executor_workers)
\ No newline at end of file
@@ -78,7 +78,7 @@ class SystemOptimizer:
         try:
             # Сохраняем начальное состояние
             self.performance_stats['memory_before'] = self._get_memory_stats()
-            self.performance_stats['cpu_before'] = psutil.cpu_percent(interval=0.1)
+            self.performance_stats['cpu_before'] = psutil.cpu_percent(interval=None)
             
             # Применяем оптимизации
             optimizations = [
@@ -102,7 +102,8 @@ class SystemOptimizer:
             
             # Сохраняем конечное состояние
             self.performance_stats['memory_after'] = self._get_memory_stats()
-            self.performance_stats['cpu_after'] = psutil.cpu_percent(interval=0.1)
+            # Загрузка CPU за время оптимизаций (с прошлого замера), без sleep
+            self.performance_stats['cpu_after'] = psutil.cpu_percent(interval=None)
             self.performance_stats['optimization_time'] = time.time() - start_time
             
             # Адаптируем конфигурацию под систему
@@ -16,28 +16,39 @@ import traceback
 import json
 import signal
 import platform
-from typing import List, Tuple, Set, Dict, Any, Optional, Deque
-from concurrent.futures import ThreadPoolExecutor
+import zlib
+import mmap
+from array import array
+from typing import List, Tuple, Set, Dict, Any, Optional, Deque, Iterator
 from collections import deque
+from dataclasses import asdict
+
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
 
 # Используем относительные импорты
 from .config import Config
 from .models import ProcessingMetrics, FaceRecord
-from .data_parser import parse_batch_records, get_global_parser
+from .data_parser import parse_batch_records, get_global_parser, open_input_lines
 from .checkpoint_manager import CheckpointManager
 from .statistics import StatisticsAnalyzer
+from .adaptive import AdaptiveController
 try:
     # Relative import when used as part of package
-    from ..processing.image_processor import ImageProcessorWithEmbedding, process_images_batch
+    from ..processing.image_processor import ImageProcessorWithEmbedding, ResizableSemaphore, process_images_batch
 except (ImportError, ValueError):
     # Absolute import when running directly
     try:
-        from processing.image_processor import ImageProcessorWithEmbedding, process_images_batch
+        from processing.image_processor import ImageProcessorWithEmbedding, ResizableSemaphore, process_images_batch
     except ImportError:
-        from src.processing.image_processor import ImageProcessorWithEmbedding, process_images_batch
-from src.utils.logger import setup_logger
-from src.utils.memory_monitor import MemoryMonitor
-from src.utils.windows_paths import get_windows_safe_path, enable_windows_long_paths
+        from src.processing.image_processor import ImageProcessorWithEmbedding, ResizableSemaphore, process_images_batch
+from utils.logger import setup_logger
+from utils.memory_monitor import MemoryMonitor
+from utils.helpers import available_cpus
+from utils.windows_paths import get_windows_safe_path, enable_windows_long_paths
 
 logger = setup_logger()
 
@@ -253,10 +264,8 @@ class BatchProcessor:
                                     record.image_size_kb = img_info.get('file_size_kb', 0)
                                     record.download_time_ms = img_info.get('download_time_ms', 0)
                                     record.is_cached = img_info.get('is_cached', False)
-                                record.image_hash = hashlib.md5(record.image_url.encode()).hexdigest()
                             elif record.image_url:
                                 record.failed_reason = img_info.get('failed_reason', 'Ошибка загрузки') if img_info else 'Ошибка загрузки'
-                                record.image_hash = hashlib.md5(record.image_url.encode()).hexdigest()
                     
                     face_records.append(record)
                     
@@ -429,7 +438,11 @@ class OptimizedMemoryManager:
 class FaceRecognitionProcessor:
     """Главный процессор обработки данных с контролем памяти"""
     
-    def __init__(self, formats: List[str], resume: bool = False):
+    # Множества метрик, которые сохраняются в журнал дельт
+    UNIQUE_FIELDS = ('unique_users', 'unique_devices', 'unique_companies', 'unique_ips')
+    
+    def __init__(self, formats: List[str], resume: bool = False, backend: str = 'stream',
+                 semaphore: Optional[ResizableSemaphore] = None, pin_workers: bool = False):
         self.metrics = ProcessingMetrics()
         self.records: List[FaceRecord] = []
         self.image_processor = None
@@ -438,11 +451,24 @@ class FaceRecognitionProcessor:
         self.report_generator = None
         self.checkpoint_manager = None
         self.resume = resume
+        self.backend = backend  # 'inmem' - файл читается целиком, 'stream' - построчно
+        self.semaphore = semaphore  # Общий лимит одновременных загрузок (None - лимит обработчика изображений)
+        self.pin_workers = pin_workers  # Число рабочих задано пользователем и не регулируется
         
         # Динамические настройки
         self.batch_size = Config.INITIAL_BATCH_SIZE
         self.max_batch_size = 20000
         self.min_batch_size = 500
+        # Регулятор батча и числа рабочих; get_adaptive_config задает только стартовые значения.
+        # Потолок рабочих - настроенное значение, но не больше доступных CPU
+        k_max = Config.MAX_WORKERS if pin_workers else max(1, min(Config.MAX_WORKERS, available_cpus()))
+        self.adaptive = AdaptiveController(
+            b_min=self.min_batch_size,
+            b_max=self.max_batch_size,
+            k_min=k_max if pin_workers else min(2, k_max),
+            k_max=k_max,
+            eta=Config.MAX_MEMORY_PERCENT / 100
+        )
         
         # Оптимизированные компоненты
         self.memory_manager = OptimizedMemoryManager()
@@ -451,6 +477,23 @@ class FaceRecognitionProcessor:
         
         # Состояние обработки
         self.processed_hashes: Set[str] = set()
+        self._pending_hashes: List[str] = []  # Хэши, еще не записанные в файл чекпоинта
+        self._hashes_file_size = 0
+        self._hashes_file_crc = 0
+        # Уникальные значения, уже записанные в журнал дельт чекпоинта
+        self._checkpointed_uniques: Dict[str, Set[str]] = {
+            name: set() for name in self.UNIQUE_FIELDS
+        }
+        self._uniques_wal_size = 0
+        self._gc_was_enabled = True
+        self.avg_line_size = 0.0  # Оценка по первым строкам, считается при подсчете строк
+        self._batch_q: Optional[asyncio.Queue] = None  # Очередь батчей между чтением и обработкой
+        self._records_file: Optional[str] = None  # Записи пишутся на диск по мере обработки
+        # Время на запись по последним батчам: время батча растет с его размером и для хвоста не годится
+        self._record_times: Deque[float] = deque(maxlen=20)
+        
+        # Снимок памяти, обновляется раз в секунду в _monitor_performance
+        self._last_mem = psutil.virtual_memory()
         self.last_checkpoint_save = 0
         self.processed_since_checkpoint = 0
         self.progress_tracker = None
@@ -502,8 +545,8 @@ class FaceRecognitionProcessor:
             signal.signal(signal.SIGINT, unix_signal_handler)
             signal.signal(signal.SIGTERM, unix_signal_handler)
     
-    async def process_file(self, input_file: str) -> bool:
-        """Обработка файла с поддержкой возобновления"""
+    async def process_file(self, input_file: str, output_dir: Optional[str] = None) -> bool:
+        """Обработка файла с поддержкой возобновления (output_dir - папка прерванного запуска)"""
         logger.info(f"🎯 Начало обработки файла: {os.path.basename(input_file)}")
         
         # Включаем поддержку длинных путей для Windows
@@ -516,6 +559,10 @@ class FaceRecognitionProcessor:
         # Начало трассировки памяти
         tracemalloc.start()
         
+        # Автоматический GC отключаем на время обработки, сборка идет в _optimize_memory_usage
+        self._gc_was_enabled = gc.isenabled()
+        gc.disable()
+        
         try:
             # Подсчет строк
             print("🔍 Подсчет записей в файле...")
@@ -532,7 +579,7 @@ class FaceRecognitionProcessor:
             print(f"💿 Свободно на диске: {system_info['disk_free_gb']:.1f} GB")
             
             # Создание папки для результатов с безопасными путями
-            self.output_dir = Config.setup_directories()
+            self.output_dir = Config.setup_directories(output_dir)
             print(f"📂 Результаты будут сохранены в: {self.output_dir}")
             
             # Инициализация менеджера чекпоинтов
@@ -546,7 +593,7 @@ class FaceRecognitionProcessor:
             
             # Инициализация процессора изображений
             print("🚀 Инициализация обработчика изображений...")
-            self.image_processor = ImageProcessorWithEmbedding(self.output_dir)
+            self.image_processor = ImageProcessorWithEmbedding(self.output_dir, semaphore=self.semaphore)
             
             # Инициализация батч-процессора
             self.batch_processor = BatchProcessor(self.image_processor, self.metrics)
@@ -666,11 +713,19 @@ class FaceRecognitionProcessor:
                 self.batch_size = checkpoint.batch_size
                 
                 # Восстанавливаем хэши и уникальные данные
-                self.processed_hashes = set(checkpoint.records_processed)
-                self.metrics.unique_users = set(checkpoint.unique_users)
-                self.metrics.unique_devices = set(checkpoint.unique_devices)
-                self.metrics.unique_companies = set(checkpoint.unique_companies)
-                self.metrics.unique_ips = set(checkpoint.unique_ips)
+                if checkpoint.hashes_sidecar:
+                    self.processed_hashes = self._load_hashes_sidecar(checkpoint.hashes_sidecar)
+                else:
+                    self.processed_hashes = set(checkpoint.records_processed)
+                if checkpoint.uniques_wal:
+                    self._load_uniques_wal(checkpoint.uniques_wal)
+                else:
+                    self.metrics.unique_users = set(checkpoint.unique_users)
+                    self.metrics.unique_devices = set(checkpoint.unique_devices)
+                    self.metrics.unique_companies = set(checkpoint.unique_companies)
+                    self.metrics.unique_ips = set(checkpoint.unique_ips)
+                if checkpoint.records_file:
+                    self._truncate_records_file(checkpoint.records_file)
                 
                 print(f"🔄 Продолжаем с позиции: {start_position:,} байт")
                 print(f"🔄 Уже обработано: {checkpoint.processed_lines:,} записей")
@@ -696,63 +751,24 @@ class FaceRecognitionProcessor:
                 else:
                     buffer_size = 1024 * 1024 * 10  # 10MB для других ОС
                 
-                with open(input_file, 'r', encoding='utf-8', buffering=buffer_size, errors='ignore') as f:
-                    # Перемещаемся к позиции возобновления
-                    if start_position > 0:
-                        f.seek(start_position)
-                    
-                    batch_data = []
-                    batch_count = 0
-                    lines_processed = 0
-                    current_byte_position = start_position
-                    
-                    batch_start_time = time.time()
-                    
-                    # Чтение файла по строкам
-                    for line in f:
-                        if not self.is_running:
-                            break
-                        
-                        line = line.strip()
-                        if not line:
-                            continue
-                        
-                        # Обновляем позицию в файле
-                        current_byte_position += len(line.encode('utf-8', errors='replace')) + 1  # +1 для символа новой строки
-                        
-                        # Генерируем хэш строки
-                        line_hash = hashlib.md5(line.encode('utf-8', errors='replace')).hexdigest()[:16]
-                        
-                        # Проверка на дубликат
-                        if line_hash in self.processed_hashes:
-                            self.metrics.total_records += 1
-                            self.metrics.duplicate_records += 1
-                            continue
-                        
-                        batch_data.append((line, line_hash))
-                        lines_processed += 1
-                        self.processed_hashes.add(line_hash)
-                        
-                        # Обрабатываем батч когда накопится достаточно данных
-                        if len(batch_data) >= self.batch_size:
-                            await self._process_and_update_batch(batch_data, current_byte_position, batch_count, input_file, total_lines)
-                            
-                            batch_data = []
-                            batch_count += 1
-                            
-                            # Динамическая настройка размера батча
-                            self._adjust_batch_size_dynamically(batch_count)
-                            
-                            # Измерение времени батча
-                            batch_time = time.time() - batch_start_time
-                            self.avg_batch_processing_time = (
-                                self.avg_batch_processing_time * 0.9 + batch_time * 0.1
-                            )
-                            batch_start_time = time.time()
+                # Ограниченная очередь: чтение ждет, пока обработка не освободит место
+                self._batch_q = asyncio.Queue(maxsize=4)
+                consumer_task = asyncio.create_task(self._consume_batches(input_file, total_lines))
+                
+                try:
+                    with open_input_lines(input_file, start_position, self.backend, buffer_size) as f:
+                        await self._read_batches(f, start_position, consumer_task)
                     
-                    # Обработка остатка
-                    if batch_data:
-                        await self._process_and_update_batch(batch_data, current_byte_position, batch_count, input_file, total_lines)
+                    # Сигнал завершения для обработчика
+                    await self._enqueue_batch(None, consumer_task)
+                    await consumer_task
+                finally:
+                    if not consumer_task.done():
+                        consumer_task.cancel()
+                        try:
+                            await consumer_task
+                        except asyncio.CancelledError:
+                            pass
             
             return True
             
@@ -761,6 +777,89 @@ class FaceRecognitionProcessor:
             traceback.print_exc()
             return False
     
+    async def _read_batches(self, f, start_position: int, consumer_task: asyncio.Task):
+        """Чтение файла (уже с позиции возобновления) и формирование батчей для очереди"""
+        batch_data = []
+        batch_count = 0
+        lines_processed = 0
+        current_byte_position = start_position
+        
+        # Чтение файла по строкам
+        for line in f:
+            if not self.is_running:
+                break
+            
+            line = line.strip()
+            if not line:
+                continue
+            
+            # Кодируем один раз; для ASCII строк (большинство) кодек UTF-8 не нужен
+            line_bytes = line.encode('ascii') if line.isascii() else line.encode('utf-8', errors='replace')
+            
+            # Обновляем позицию в файле
+            current_byte_position += len(line_bytes) + 1  # +1 для символа новой строки
+            
+            # Генерируем хэш строки
+            line_hash = hashlib.md5(line_bytes).hexdigest()[:16]
+            
+            # Проверка на дубликат
+            if line_hash in self.processed_hashes:
+                self.metrics.total_records += 1
+                self.metrics.duplicate_records += 1
+                continue
+            
+            batch_data.append((line, line_hash))
+            lines_processed += 1
+            self.processed_hashes.add(line_hash)
+            
+            # Отправляем батч когда накопится достаточно данных
+            if len(batch_data) >= self.batch_size:
+                await self._enqueue_batch((batch_data, current_byte_position, batch_count), consumer_task)
+                
+                batch_data = []
+                batch_count += 1
+        
+        # Отправка остатка
+        if batch_data:
+            await self._enqueue_batch((batch_data, current_byte_position, batch_count), consumer_task)
+    
+    async def _enqueue_batch(self, item: Optional[Tuple[List[Tuple[str, str]], int, int]],
+                             consumer_task: asyncio.Task):
+        """Поставить батч в очередь, не зависая при падении обработчика"""
+        put_task = asyncio.ensure_future(self._batch_q.put(item))
+        done, _ = await asyncio.wait({put_task, consumer_task}, return_when=asyncio.FIRST_COMPLETED)
+        
+        if put_task not in done:
+            put_task.cancel()
+            # Пробрасываем ошибку обработчика
+            consumer_task.result()
+            raise RuntimeError("Обработчик батчей завершился раньше времени")
+    
+    async def _consume_batches(self, input_file: str, total_lines: int):
+        """Обработка батчей из очереди"""
+        batch_start_time = time.time()
+        
+        while True:
+            item = await self._batch_q.get()
+            if item is None:
+                break
+            
+            batch_data, current_position, batch_count = item
+            batch_len = len(batch_data)  # Батч очищается после обработки
+            await self._process_and_update_batch(batch_data, current_position, batch_count, input_file, total_lines)
+            
+            # Измерение времени батча
+            batch_time = time.time() - batch_start_time
+            self.avg_batch_processing_time = (
+                self.avg_batch_processing_time * 0.9 + batch_time * 0.1
+            )
+            if batch_len:
+                self._record_times.append(batch_time / batch_len)
+            
+            # Динамическая настройка размера батча
+            self._adjust_batch_size_dynamically(batch_count + 1)
+            batch_start_time = time.time()
+    
     async def _process_and_update_batch(self, batch_data: List[Tuple[str, str]], 
                                       current_position: int, batch_count: int,
                                       input_file: str, total_lines: int):
@@ -770,8 +869,8 @@ class FaceRecognitionProcessor:
             batch_data, current_position
         )
         
-        # Добавление записей в общий список
-        self.records.extend(batch_records)
+        # Записи сразу уходят на диск, в памяти остаются только счетчики
+        await self._append_batch_jsonl(batch_records)
         
         # Обновление счетчиков
         processed_in_batch = len(batch_data)
@@ -779,13 +878,12 @@ class FaceRecognitionProcessor:
         self.metrics.processed_records += len(batch_records)
         self.total_batches_processed += 1
         
+        # Записи уже на диске - освобождаем их сразу, не дожидаясь выхода из кадра
+        batch_records.clear()
+        
         # Обновление прогресса (только каждые 1000 записей для уменьшения оверхеда)
         if self.metrics.total_records % 1000 == 0:
-            memory_usage_mb = 0
-            try:
-                memory_usage_mb = psutil.virtual_memory().used / (1024**2)
-            except:
-                pass
+            memory_usage_mb = self._last_mem.used / (1024**2)
             
             self.progress_tracker.update(
                 self.metrics.total_records, 
@@ -793,6 +891,10 @@ class FaceRecognitionProcessor:
                 memory_usage_mb
             )
         
+        # Хэши попадают в чекпоинт только после обработки их батча
+        self._pending_hashes.extend(line_hash for _, line_hash in batch_data)
+        batch_data.clear()
+        
         # Сохранение чекпоинта
         self.processed_since_checkpoint += processed_in_batch
         if self.processed_since_checkpoint >= Config.CHECKPOINT_INTERVAL:
@@ -802,9 +904,6 @@ class FaceRecognitionProcessor:
                 current_position
             )
             self.processed_since_checkpoint = 0
-            
-            # Промежуточное сохранение записей
-            await self._save_records_intermediate()
         
         # Оптимизация памяти каждые 10 батчей
         if batch_count % 10 == 0:
@@ -821,167 +920,120 @@ class FaceRecognitionProcessor:
                     parser.clear_cache()
                     logger.debug(f"Очищен кэш парсера (было {cache_size} записей)")
             
-            # Принудительный сбор мусора
-            collected = gc.collect()
+            # Быстрая частичная сборка; полная - только при нехватке памяти
+            if self._last_mem.percent > 80:
+                collected = gc.collect()
+            else:
+                collected = gc.collect(1)
             logger.debug(f"Собрано мусора: {collected} объектов")
             
             # Проверка памяти и приостановка если нужно
             try:
-                memory_percent = psutil.virtual_memory().percent
+                memory_percent = self._last_mem.percent
                 if memory_percent > 85:
-                    logger.warning(f"Высокое использование памяти ({memory_percent}%), пауза 2 секунды")
-                    await asyncio.sleep(2)
+                    # Паузы не нужны: очередь батчей сама притормаживает чтение
+                    logger.warning(f"Высокое использование памяти ({memory_percent}%)")
             except:
                 pass
                 
         except Exception as e:
             logger.debug(f"Ошибка оптимизации памяти: {e}")
     
-    async def _save_records_intermediate(self):
-        """Промежуточное сохранение записей для экономии памяти"""
-        if len(self.records) < 10000:
-            return
-        
-        try:
-            # Сохраняем часть записей во временный файл
-            save_count = len(self.records) // 2
-            records_to_save = self.records[:save_count]
-            
+    def _records_stream_file(self) -> str:
+        """Путь к накопительному JSONL файлу записей"""
+        if self._records_file is None:
             # Создаем безопасный путь для Windows
             temp_dir = get_windows_safe_path(self.output_dir, Config.TEMP_FOLDER)
             os.makedirs(temp_dir, exist_ok=True)
-            
-            temp_file = get_windows_safe_path(
-                temp_dir, 
-                f"records_temp_{int(time.time())}.jsonl"
-            )
-            
-            # Используем быструю сериализацию
-            with open(temp_file, 'w', encoding='utf-8', errors='ignore') as f:
-                for record in records_to_save:
+            self._records_file = get_windows_safe_path(temp_dir, "records.jsonl")
+        return self._records_file
+    
+    async def _append_batch_jsonl(self, batch_records: List[FaceRecord]):
+        """Дописать записи батча в накопительный JSONL файл"""
+        try:
+            # Сохраняем все поля dataclass (включая image_base64), чтобы запись
+            # восстанавливалась через FaceRecord(**data).
+            # orjson сериализует dataclass напрямую и пишет сразу в bytes
+            with open(self._records_stream_file(), 'ab') as f:
+                for record in batch_records:
                     try:
-                        record_dict = record.to_dict()
-                        f.write(json.dumps(record_dict, ensure_ascii=False) + '\n')
+                        if _HAS_ORJSON:
+                            f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+                        else:
+                            f.write((json.dumps(asdict(record), ensure_ascii=False) + '\n').encode('utf-8', errors='ignore'))
                     except Exception as e:
                         logger.debug(f"Ошибка сериализации записи: {e}")
                         continue
-            
-            # Удаляем сохраненные записи из памяти
-            del self.records[:save_count]
-            
-            logger.debug(f"Сохранено {save_count} записей во временный файл")
-            
-            # Очистка памяти
-            gc.collect()
-            
         except Exception as e:
             logger.error(f"Ошибка при сохранении записей: {e}")
     
-    async def _load_saved_records(self):
-        """Загрузить сохраненные записи из временных файлов"""
-        temp_dir = get_windows_safe_path(self.output_dir, Config.TEMP_FOLDER)
-        if not os.path.exists(temp_dir):
+    def _iter_saved_records(self) -> Iterator[FaceRecord]:
+        """Потоковое чтение сохраненных записей"""
+        records_file = self._records_stream_file()
+        if not os.path.exists(records_file):
             return
         
         try:
-            temp_files = []
-            for filename in os.listdir(temp_dir):
-                if filename.startswith('records_temp_') and filename.endswith('.jsonl'):
-                    filepath = os.path.join(temp_dir, filename)
-                    temp_files.append((os.path.getmtime(filepath), filepath))
-            
-            # Сортируем по времени создания
-            temp_files.sort()
-            
-            loaded_count = 0
-            for _, filepath in temp_files:
-                try:
-                    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                        for line in f:
-                            if line.strip():
-                                try:
-                                    data = json.loads(line.strip())
-                                    record = FaceRecord(**data)
-                                    self.records.append(record)
-                                    loaded_count += 1
-                                except json.JSONDecodeError as e:
-                                    logger.debug(f"Ошибка парсинга JSON: {e}")
-                                    continue
-                    
-                    # Удаляем временный файл
-                    os.remove(filepath)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка загрузки файла {filepath}: {e}")
-            
-            if loaded_count > 0:
-                logger.info(f"Загружено {loaded_count} записей из временных файлов")
-                
-        except Exception as e:
-            logger.error(f"Ошибка загрузки сохраненных записей: {e}")
+            with open(records_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            data = orjson.loads(line) if _HAS_ORJSON else json.loads(line)
+                            record = FaceRecord(**data)
+                        except (ValueError, TypeError) as e:
+                            logger.debug(f"Ошибка парсинга записи: {e}")
+                            continue
+                        yield record
+        except OSError as e:
+            logger.error(f"Ошибка загрузки файла {records_file}: {e}")
+    
+    def load_all_completed_samples(self) -> List[FaceRecord]:
+        """Загрузить все обработанные записи с диска (только для генерации отчетов)"""
+        return list(self._iter_saved_records())
     
     def _adjust_batch_size_dynamically(self, batch_count: int):
         """Динамическая настройка размера батча на основе производительности"""
         try:
-            # Получаем текущие метрики
-            memory_percent = psutil.virtual_memory().percent
-            available_gb = psutil.virtual_memory().available / (1024**3)
-            
-            # Рассчитываем целевую скорость обработки
-            target_records_per_second = 1000  # Целевая скорость
-            
-            # Адаптируем размер батча
-            if memory_percent > 85 or available_gb < 0.5:
-                # Критическая ситуация - резко уменьшаем
-                new_size = max(self.min_batch_size, self.batch_size // 2)
-                if new_size != self.batch_size:
+            # Метрики последнего батча: память из снимка монитора, CPU - без блокировки
+            p50, p95 = self.adaptive.latency_quantiles(self._record_times)
+            metrics = {
+                'memory_percent': self._last_mem.percent,
+                'available_gb': self._last_mem.available / (1024**3),
+                'cpu_percent': psutil.cpu_percent(interval=None),
+                'batch_time': self.avg_batch_processing_time,
+                'record_time_p50': p50,
+                'record_time_p95': p95
+            }
+            new_size, new_workers = self.adaptive.propose(metrics, self.batch_size, Config.MAX_WORKERS)
+            
+            if new_size != self.batch_size:
+                if new_size < self.batch_size and self.adaptive.memory_headroom(metrics['available_gb']) == 0:
                     logger.warning(f"Критическая память: уменьшаем batch_size до {new_size}")
-            elif memory_percent > 75:
-                # Высокая нагрузка - немного уменьшаем
-                new_size = max(self.min_batch_size, int(self.batch_size * 0.7))
-                if new_size != self.batch_size and batch_count % 5 == 0:
-                    logger.info(f"Высокая нагрузка памяти: уменьшаем batch_size до {new_size}")
-            elif self.avg_batch_processing_time > 10:
-                # Медленная обработка - уменьшаем
-                new_size = max(self.min_batch_size, int(self.batch_size * 0.8))
-                if new_size != self.batch_size:
-                    logger.info(f"Медленная обработка: уменьшаем batch_size до {new_size}")
-            elif (memory_percent < 60 and available_gb > 2 and 
-                  self.avg_batch_processing_time < 5 and 
-                  self.batch_size < self.max_batch_size):
-                # Хорошие условия - увеличиваем
-                new_size = min(self.max_batch_size, int(self.batch_size * 1.5))
-                if new_size != self.batch_size and batch_count % 10 == 0:
-                    logger.info(f"Хорошие условия: увеличиваем batch_size до {new_size}")
-            else:
-                new_size = self.batch_size
+                elif batch_count % 10 == 0:
+                    logger.info(f"Настройка batch_size: {self.batch_size} -> {new_size}")
             
-            # Применяем новый размер
+            # Применяем новые значения до отправки следующего батча
             self.batch_size = new_size
+            if not self.pin_workers:
+                Config.MAX_WORKERS = new_workers
+                if self.semaphore is not None:
+                    self.semaphore.resize(new_workers)
             
         except Exception as e:
             logger.debug(f"Ошибка настройки размера батча: {e}")
     
     async def _display_optimized_progress(self):
         """Оптимизированное отображение прогресса"""
-        last_update = 0
-        
         while self.is_running:
             try:
-                current_time = time.time()
-                
                 # Обновляем каждые 2 секунды для уменьшения оверхеда
-                if current_time - last_update >= 2.0 and self.progress_tracker:
+                await asyncio.sleep(2.0)
+                
+                if self.progress_tracker:
                     # Выводим прогресс (обновление трекера происходит в основном потоке)
-                    
-                    # Выводим прогресс
                     progress_str = self.progress_tracker.get_progress_string(self.metrics)
                     sys.stdout.write('\r' + progress_str + ' ' * 10)
                     sys.stdout.flush()
-                    
-                    last_update = current_time
-                
-                await asyncio.sleep(0.5)
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -1005,6 +1057,9 @@ class FaceRecognitionProcessor:
             try:
                 current_time = time.time()
                 
+                # Обновляем снимок памяти для горячего пути обработки батчей
+                self._last_mem = psutil.virtual_memory()
+                
                 # Проверяем каждые 5 секунд
                 if current_time - last_check >= 5:
                     # Получаем статистику парсера
@@ -1045,26 +1100,173 @@ class FaceRecognitionProcessor:
                 duplicate_records=self.metrics.duplicate_records,
                 last_position=position,
                 batch_size=self.batch_size,
-                records_processed=list(self.processed_hashes),
-                unique_users=list(self.metrics.unique_users),
-                unique_devices=list(self.metrics.unique_devices),
-                unique_companies=list(self.metrics.unique_companies),
-                unique_ips=list(self.metrics.unique_ips)
+                records_processed=[],
+                unique_users=[],
+                unique_devices=[],
+                unique_companies=[],
+                unique_ips=[],
+                hashes_sidecar=self._flush_hashes_sidecar(),
+                uniques_wal=self._flush_uniques_wal(),
+                records_file=self._records_file_state()
             )
     
+    def _records_file_state(self) -> Dict[str, Any]:
+        """Размер файла записей: все записи до позиции чекпоинта уже дописаны"""
+        records_file = self._records_stream_file()
+        try:
+            size = os.path.getsize(records_file)
+        except OSError:
+            size = 0
+        
+        return {
+            'path': os.path.basename(records_file),
+            'size': size
+        }
+    
+    def _truncate_records_file(self, state: Dict[str, Any]):
+        """Отбросить записи, дописанные после последнего успешного чекпоинта"""
+        records_file = self._records_stream_file()
+        size = int(state.get('size', 0))
+        
+        try:
+            current_size = os.path.getsize(records_file)
+            if current_size > size:
+                with open(records_file, 'r+b') as f:
+                    f.truncate(size)
+            elif current_size < size:
+                logger.warning("Файл записей короче, чем в чекпоинте: часть записей потеряна")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Ошибка усечения файла записей: {e}")
+    
+    def _flush_uniques_wal(self) -> Dict[str, Any]:
+        """Дописать в журнал только новые уникальные значения с прошлого чекпоинта"""
+        wal_file = self.checkpoint_manager.uniques_wal_file
+        
+        delta = {}
+        for name, saved in self._checkpointed_uniques.items():
+            new_values = getattr(self.metrics, name) - saved
+            if new_values:
+                delta[name] = new_values
+        
+        if delta:
+            try:
+                payload = {name: list(values) for name, values in delta.items()}
+                if _HAS_ORJSON:
+                    line = orjson.dumps(payload, option=orjson.OPT_APPEND_NEWLINE)
+                else:
+                    line = (json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8')
+                
+                # Первая запись перезаписывает журнал от предыдущих запусков
+                mode = 'ab' if self._uniques_wal_size else 'wb'
+                with open(wal_file, mode) as f:
+                    f.write(line)
+                self._uniques_wal_size += len(line)
+                
+                for name, values in delta.items():
+                    self._checkpointed_uniques[name].update(values)
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала чекпоинта: {e}")
+        
+        return {
+            'path': os.path.basename(wal_file),
+            'size': self._uniques_wal_size
+        }
+    
+    def _load_uniques_wal(self, wal: Dict[str, Any]):
+        """Восстановить уникальные значения из журнала дельт"""
+        wal_file = self.checkpoint_manager.uniques_wal_file
+        size = int(wal.get('size', 0))
+        
+        try:
+            with open(wal_file, 'rb') as f:
+                data = f.read(size)
+            
+            if len(data) != size:
+                logger.warning("Журнал чекпоинта поврежден, уникальные значения не восстановлены")
+                return
+            
+            for line in data.splitlines():
+                if not line.strip():
+                    continue
+                payload = orjson.loads(line) if _HAS_ORJSON else json.loads(line)
+                for name, values in payload.items():
+                    if name in self._checkpointed_uniques:
+                        getattr(self.metrics, name).update(values)
+                        self._checkpointed_uniques[name].update(values)
+            
+            # Отбрасываем хвост, записанный после последнего успешного чекпоинта
+            with open(wal_file, 'r+b') as f:
+                f.truncate(size)
+            
+            self._uniques_wal_size = size
+            
+        except Exception as e:
+            logger.error(f"Ошибка загрузки журнала чекпоинта: {e}")
+    
+    def _flush_hashes_sidecar(self) -> Dict[str, Any]:
+        """Дописать новые хэши в бинарный файл рядом с чекпоинтом"""
+        hashes_file = self.checkpoint_manager.hashes_file
+        
+        if self._pending_hashes:
+            try:
+                # Хэш - 16 hex символов, упаковываем в uint64
+                chunk = array('Q', [int(h, 16) for h in self._pending_hashes]).tobytes()
+                # Первая запись перезаписывает файл от предыдущих запусков
+                mode = 'ab' if self._hashes_file_size else 'wb'
+                with open(hashes_file, mode) as f:
+                    f.write(chunk)
+                self._hashes_file_size += len(chunk)
+                self._hashes_file_crc = zlib.crc32(chunk, self._hashes_file_crc)
+                self._pending_hashes.clear()
+            except Exception as e:
+                logger.error(f"Ошибка записи хэшей чекпоинта: {e}")
+        
+        return {
+            'path': os.path.basename(hashes_file),
+            'size': self._hashes_file_size,
+            'crc': self._hashes_file_crc
+        }
+    
+    def _load_hashes_sidecar(self, sidecar: Dict[str, Any]) -> Set[str]:
+        """Загрузить хэши из бинарного файла чекпоинта"""
+        hashes_file = self.checkpoint_manager.hashes_file
+        size = int(sidecar.get('size', 0))
+        
+        try:
+            with open(hashes_file, 'rb') as f:
+                data = f.read(size)
+            
+            if len(data) != size or zlib.crc32(data) != sidecar.get('crc'):
+                logger.warning("Файл хэшей чекпоинта поврежден, дедупликация начнется заново")
+                return set()
+            
+            # Отбрасываем хвост, записанный после последнего успешного чекпоинта
+            with open(hashes_file, 'r+b') as f:
+                f.truncate(size)
+            
+            self._hashes_file_size = size
+            self._hashes_file_crc = sidecar['crc']
+            
+            values = array('Q')
+            values.frombytes(data)
+            return {format(value, '016x') for value in values}
+            
+        except Exception as e:
+            logger.error(f"Ошибка загрузки хэшей чекпоинта: {e}")
+            return set()
+    
     async def _generate_reports(self):
         """Генерация выбранных отчетов"""
         logger.info("📄 Генерация отчетов...")
         
-        # Загружаем сохраненные записи если есть
-        await self._load_saved_records()
-        
         print("\n" + "="*80)
         print("📊 ИТОГОВАЯ СТАТИСТИКА ОБРАБОТКИ")
         print("="*80)
         
-        # Основная статистика
-        stats = StatisticsAnalyzer.analyze(self.records)
+        # Основная статистика считается потоком по сохраненным записям
+        stats = StatisticsAnalyzer.analyze(self._iter_saved_records())
         
         print(f"✅ Всего записей обработано: {self.metrics.total_records:,}")
         print(f"✅ Успешных фото: {self.metrics.valid_images:,}")
@@ -1105,15 +1307,25 @@ class FaceRecognitionProcessor:
         if "HTML" in self.formats:
             print("🔄 Создание HTML отчета...")
             # Используем отложенный импорт для избежания циклической зависимости
-            from src.processing.report_generator import ReportGenerator
+            from processing.report_generator import ReportGenerator
+            # HTML отчету нужны все записи сразу
+            self.records = self.load_all_completed_samples()
             report_generator = ReportGenerator(self.output_dir)
             html_report = report_generator.generate_html_report(self.records, self.metrics)
+            # Записи больше не нужны - отпускаем их до создания README
+            self.records = []
             reports_created.append(("🌐 HTML отчет", html_report))
             print("✅ HTML отчет создан")
         
         # Создание README файла
         self._create_readme(reports_created)
         
+        # Удаляем временный файл записей
+        try:
+            os.remove(self._records_stream_file())
+        except OSError:
+            pass
+        
         # Вывод результатов
         print("\n🎉 ОТЧЕТЫ УСПЕШНО СОЗДАНЫ")
         print("="*80)
@@ -1197,24 +1409,48 @@ class FaceRecognitionProcessor:
         loop = asyncio.get_event_loop()
         
         def count_lines_sync():
-            count = 0
-            # Адаптивный размер буфера
-            if platform.system() == "Windows":
-                buffer_size = 1024 * 1024 * 4  # 4MB для Windows
-            else:
-                buffer_size = 1024 * 1024 * 8  # 8MB для других ОС
+            avg_line_size = 0.0
+            
+            if os.path.getsize(file_path) == 0:
+                return 0, avg_line_size
             
-            with open(file_path, 'r', encoding='utf-8', errors='ignore', buffering=buffer_size) as f:
-                while True:
-                    buffer = f.read(buffer_size)
-                    if not buffer:
+            # mmap: подсчет идет в C без построчного чтения и буферов файла
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Подсказка ядру о последовательном чтении
+                if hasattr(os, 'posix_fadvise'):
+                    try:
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    except OSError:
+                        pass
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    try:
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    except OSError:
+                        pass
+                
+                # Средний размер строки по первым 1000 строкам
+                position = -1
+                lines_seen = 0
+                while lines_seen < 1000:
+                    next_position = mm.find(b'\n', position + 1)
+                    if next_position == -1:
                         break
-                    count += buffer.count('\n')
+                    position = next_position
+                    lines_seen += 1
+                if lines_seen > 0:
+                    avg_line_size = (position + 1) / lines_seen
+                
+                # У mmap нет count(), а у memoryview нет поиска: срез mm[a:b] - копия, поэтому
+                # считаем кусками по 16 MB - в памяти одновременно не больше одного куска
+                count = 0
+                chunk_size = 1024 * 1024 * 16
+                for offset in range(0, len(mm), chunk_size):
+                    count += mm[offset:offset + chunk_size].count(b'\n')
             
-            return count
+            return count, avg_line_size
         
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            result = await loop.run_in_executor(executor, count_lines_sync)
+        # Пул потоков цикла событий по умолчанию, без создания нового на каждый вызов
+        result, self.avg_line_size = await loop.run_in_executor(None, count_lines_sync)
         
         return result
     
@@ -1229,23 +1465,10 @@ class FaceRecognitionProcessor:
             
             # Если мы в начале файла, используем start_position
             if start_position == 0:
-                # Оцениваем средний размер строки
-                if processed_lines > 1000:
-                    # Читаем первые 1000 строк для оценки
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        total_bytes = 0
-                        lines_read = 0
-                        for _ in range(min(1000, processed_lines)):
-                            line = f.readline()
-                            if not line:
-                                break
-                            total_bytes += len(line.encode('utf-8', errors='replace'))
-                            lines_read += 1
-                        
-                        if lines_read > 0:
-                            avg_line_size = total_bytes / lines_read
-                            estimated_position = int(start_position + (processed_lines * avg_line_size))
-                            return min(estimated_position, file_size)
+                # Средний размер строки уже известен после подсчета строк
+                if processed_lines > 1000 and self.avg_line_size > 0:
+                    estimated_position = int(start_position + (processed_lines * self.avg_line_size))
+                    return min(estimated_position, file_size)
             
             return start_position
             
@@ -1265,13 +1488,16 @@ class FaceRecognitionProcessor:
             self.processed_hashes.clear()
             
             # Принудительный сбор мусора
-            for _ in range(2):  # Уменьшаем количество циклов
-                gc.collect()
+            gc.collect()
             
             logger.info("Выполнена финальная очистка ресурсов")
             
         except Exception as e:
             logger.error(f"Ошибка при финальной очистке: {e}")
+        finally:
+            # Возвращаем автоматический GC
+            if self._gc_was_enabled:
+                gc.enable()
     
     def get_performance_report(self) -> Dict[str, Any]:
         """Получить отчет о производительности"""
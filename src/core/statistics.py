@@ -2,110 +2,447 @@
 Статистический анализатор
 """
 
+import re
 import json
-from collections import defaultdict
-from typing import List, Dict, Any
+import numpy as np
+from operator import attrgetter
+from types import MappingProxyType
+from collections import defaultdict, Counter
+from typing import Iterable, Sequence, Dict, Any, Tuple, Mapping
 from core.models import FaceRecord
 
+try:
+    import pandas as pd
+    _HAS_PANDAS = True
+except ImportError:
+    _HAS_PANDAS = False
+
+try:
+    from numba import njit, prange, get_num_threads
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# Строковые поля записи, которые разворачиваются в колонки (SoA)
+_STRING_FIELDS = ('company_id', 'gender', 'age', 'device_id', 'event_type',
+                  'user_list', 'score', 'timestamp', 'user_name')
+
+# Категориальные колонки и ключи их счетчиков в статистике
+_CATEGORY_COLUMNS = (('company_id', 'by_company'), ('gender', 'by_gender'),
+                     ('device_id', 'by_device'), ('event_type', 'by_event_type'),
+                     ('user_list', 'by_user_list'))
+
+# Возрастные группы: 0 - неизвестно, далее границы групп
+_AGE_LABELS = ('Неизвестно', 'Дети (<18)', 'Молодые (18-29)', 'Взрослые (30-49)', 'Старшие (50+)')
+_AGE_BINS = np.array([18, 30, 50])
+
+# Диапазоны оценок: 0 - нет оценки, далее границы диапазонов
+_SCORE_LABELS = ('Н/Д', '<50%', '50-69%', '70-89%', '90-100%')
+_SCORE_BINS = np.array([50, 70, 90])
+
+# Канонический формат "YYYY-MM-DD HH:MM:SS": час берется срезом [11:13]
+_TS_CANONICAL_RE = re.compile(r'\S{10} \d\d:')
+# Остальные форматы: часть второго слова до ':' (как split()[1].split(':')[0])
+_TS_RE = re.compile(r'^\s*\S+\s+([^\s:]*)')
+
+# Метки часов заранее: для канонических "HH" метка берется из таблицы без форматирования
+_HOUR_LABELS = tuple(f"{h:02d}:00" for h in range(24))
+_HOUR_LABEL_BY_TEXT = {label[:2]: label for label in _HOUR_LABELS}
+
+# С какого числа записей векторизация окупает построение колонок
+_VECTORIZE_THRESHOLD = 1_000
+
+# Пустой топ: топы отдаются только для чтения, поэтому один объект на всех
+_EMPTY_TOP = MappingProxyType({})
+
+# С какого числа записей бакеты считаются параллельно по ядрам
+_PARALLEL_THRESHOLD = 1_000_000
+
+# Оценка после удаления '%' и пробелов: десятичное число со знаком, без экспоненты и inf.
+# Общее правило для поштучного и векторизованного разбора
+_SCORE_RE = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)')
+
+# Значения-заглушки, означающие отсутствие данных
+_ND = frozenset(('Н/Д', '', None))
+
+
+def _parse_age(age: str) -> int:
+    """Возраст числом, 0 если неизвестен"""
+    if age in _ND:
+        return 0
+    # Проверяем строку заранее вместо перехвата ValueError
+    value = age.strip()
+    digits = value[1:] if value[:1] in ('+', '-') else value
+    if not digits.isdecimal():
+        return 0
+    # Ограничиваем диапазон, чтобы значение поместилось в int64
+    return max(-1000, min(1000, int(value)))
+
+
+def _parse_score(score: str) -> float:
+    """Оценка числом, NaN если ее нет"""
+    if score in _ND:
+        return float('nan')
+    # Убираем символы процента и пробелы
+    value = score.replace('%', '').replace(' ', '')
+    if not _SCORE_RE.fullmatch(value):
+        return float('nan')
+    return float(value)
+
+
+def _age_bucket(age: str) -> int:
+    """Индекс возрастной группы в _AGE_LABELS по строке возраста"""
+    age = _parse_age(age)
+    if age == 0:
+        return 0
+    elif age < 18:
+        return 1
+    elif age < 30:
+        return 2
+    elif age < 50:
+        return 3
+    else:
+        return 4
+
+
+def _score_bucket(score: str) -> int:
+    """Индекс диапазона оценки в _SCORE_LABELS по строке оценки"""
+    score = _parse_score(score)
+    if score != score:  # NaN - оценки нет
+        return 0
+    elif score < 50:
+        return 1
+    elif score < 70:
+        return 2
+    elif score < 90:
+        return 3
+    else:
+        return 4
+
+
+def _hour_label(timestamp: str):
+    """Метка часа по строке времени (None если не удалось разобрать)"""
+    parts = timestamp.split()
+    if len(parts) < 2:
+        return None
+    hour = parts[1].split(':')[0]
+    # Нестандартные значения часа (например "7") оставляем как есть
+    return _HOUR_LABEL_BY_TEXT.get(hour) or f"{hour}:00"
+
+
+if _HAS_NUMBA:
+    @njit(cache=True)
+    def _bucket_counts(ages, scores, has_image, age_out, score_out, image_out):
+        """Возрастные группы, диапазоны оценок и наличие фото за один проход"""
+        for i in range(ages.size):
+            age = ages[i]
+            age_out[(age != 0) * (1 + (age >= 18) + (age >= 30) + (age >= 50))] += 1
+            
+            score = scores[i]
+            if score != score:  # NaN - оценки нет
+                score_out[0] += 1
+            else:
+                score_out[1 + (score >= 50) + (score >= 70) + (score >= 90)] += 1
+            
+            image_out[0] += has_image[i]
+    
+    @njit(parallel=True, cache=True)
+    def _bucket_counts_parallel(ages, scores, has_image, age_out, score_out, image_out):
+        """То же по блокам в потоках: у каждого блока своя строка частичных счетчиков"""
+        n_chunks = age_out.shape[0]
+        chunk = (ages.size + n_chunks - 1) // n_chunks
+        for c in prange(n_chunks):
+            start = min(c * chunk, ages.size)
+            stop = min(start + chunk, ages.size)
+            _bucket_counts(ages[start:stop], scores[start:stop], has_image[start:stop],
+                           age_out[c], score_out[c], image_out[c])
+
+
 class StatisticsAnalyzer:
     """Анализатор статистики данных"""
     
     @staticmethod
-    def analyze(records: List[FaceRecord]) -> Dict[str, Any]:
-        """Анализ статистики записей"""
-        stats = {
-            'total_records': len(records),
-            'by_company': defaultdict(int),
-            'by_gender': defaultdict(int),
-            'by_age_group': defaultdict(int),
-            'by_device': defaultdict(int),
-            'by_event_type': defaultdict(int),
-            'by_user_list': defaultdict(int),
-            'with_images': 0,
-            'without_images': 0,
-            'score_distribution': defaultdict(int),
-            'hourly_distribution': defaultdict(int),
-            'top_users': defaultdict(int),
-            'top_devices': defaultdict(int)
-        }
+    def analyze(records: Iterable[FaceRecord]) -> Dict[str, Any]:
+        """Анализ статистики записей (список или поток)
+        
+        top_users и top_devices возвращаются как неизменяемые MappingProxyType:
+        читаются как dict, для изменения нужна копия через dict(...)
+        """
+        # Длина известна только у списка
+        total = len(records) if hasattr(records, '__len__') else None
+        if total == 0:
+            return StatisticsAnalyzer._empty_stats()
+        
+        # Поток идет по записям: колонки потребовали бы держать в памяти все его строки
+        if total is not None and total >= _VECTORIZE_THRESHOLD:
+            if _HAS_PANDAS:
+                return StatisticsAnalyzer._analyze_vectorized(records)
+            if _HAS_NUMBA:
+                return StatisticsAnalyzer._analyze_compiled(records)
+        
+        # Сюда доходят потоки и списки меньше порога.
+        # Все счетчики - локальные, словарь статистики собирается один раз в конце
+        by_company = defaultdict(int)
+        device_counts = Counter()
+        top_users = Counter()
+        # Счетчики с малым заранее известным набором ключей - обычные dict с .get,
+        # без вызова __missing__ у defaultdict
+        by_gender = {}
+        by_event_type = {}
+        by_user_list = {}
+        hourly = {}
+        # Группы возраста и оценок считаем в списках по индексу, без хеширования меток
+        age_counts = [0] * len(_AGE_LABELS)
+        score_counts = [0] * len(_SCORE_LABELS)
+        with_images = 0
         
         for record in records:
             # По компании
-            stats['by_company'][record.company_id] += 1
+            by_company[record.company_id] += 1
             
             # По полу
-            stats['by_gender'][record.gender] += 1
+            gender = record.gender
+            by_gender[gender] = by_gender.get(gender, 0) + 1
             
             # По возрастным группам
-            try:
-                age = int(record.age) if record.age != 'Н/Д' else 0
-                if age == 0:
-                    stats['by_age_group']['Неизвестно'] += 1
-                elif age < 18:
-                    stats['by_age_group']['Дети (<18)'] += 1
-                elif age < 30:
-                    stats['by_age_group']['Молодые (18-29)'] += 1
-                elif age < 50:
-                    stats['by_age_group']['Взрослые (30-49)'] += 1
-                else:
-                    stats['by_age_group']['Старшие (50+)'] += 1
-            except:
-                stats['by_age_group']['Неизвестно'] += 1
+            age_counts[_age_bucket(record.age)] += 1
             
-            # По устройству
-            stats['by_device'][record.device_id] += 1
+            # По устройству (этот же счетчик дает топ устройств)
+            device_counts[record.device_id] += 1
             
             # По типу события
-            stats['by_event_type'][record.event_type] += 1
+            event_type = record.event_type
+            by_event_type[event_type] = by_event_type.get(event_type, 0) + 1
             
             # По статусу в списке
-            stats['by_user_list'][record.user_list] += 1
+            user_list = record.user_list
+            by_user_list[user_list] = by_user_list.get(user_list, 0) + 1
             
-            # По наличию изображений
-            if record.image_base64:
-                stats['with_images'] += 1
-            else:
-                stats['without_images'] += 1
+            # По наличию изображений: без ветвления, число без фото - после цикла
+            with_images += bool(record.image_base64)
             
             # Распределение по оценкам
-            try:
-                if record.score != 'Н/Д':
-                    # Преобразуем score в строку, если это не строка
-                    score_str = str(record.score)
-                    # Убираем символы процента и пробелы
-                    score_clean = score_str.replace('%', '').replace(' ', '')
-                    # Пытаемся преобразовать в float
-                    score = float(score_clean)
-                    if score < 50:
-                        stats['score_distribution']['<50%'] += 1
-                    elif score < 70:
-                        stats['score_distribution']['50-69%'] += 1
-                    elif score < 90:
-                        stats['score_distribution']['70-89%'] += 1
-                    else:
-                        stats['score_distribution']['90-100%'] += 1
-                else:
-                    stats['score_distribution']['Н/Д'] += 1
-            except:
-                stats['score_distribution']['Н/Д'] += 1
+            score_counts[_score_bucket(record.score)] += 1
             
             # Распределение по часам
-            try:
-                hour = record.timestamp.split()[1].split(':')[0]
-                stats['hourly_distribution'][f"{hour}:00"] += 1
-            except:
-                pass
+            hour_label = _hour_label(record.timestamp)
+            if hour_label is not None:
+                hourly[hour_label] = hourly.get(hour_label, 0) + 1
             
             # Топ пользователей
-            stats['top_users'][record.user_name] += 1
-            
-            # Топ устройств
-            stats['top_devices'][record.device_id] += 1
+            top_users[record.user_name] += 1
+        
+        # Длину потока дает любой счетчик, который увеличивается на каждую запись
+        if total is None:
+            total = sum(by_gender.values())
+            if total == 0:
+                return StatisticsAnalyzer._empty_stats()
+        
+        # Топы: most_common(10) выбирает через кучу без полной сортировки
+        return {
+            'total_records': total,
+            'by_company': dict(by_company),
+            'by_gender': by_gender,
+            'by_age_group': {label: c for label, c in zip(_AGE_LABELS, age_counts) if c},
+            'by_device': dict(device_counts),
+            'by_event_type': by_event_type,
+            'by_user_list': by_user_list,
+            'with_images': with_images,
+            'without_images': total - with_images,
+            'score_distribution': {label: c for label, c in zip(_SCORE_LABELS, score_counts) if c},
+            'hourly_distribution': hourly,
+            'top_users': MappingProxyType(dict(top_users.most_common(10))),
+            'top_devices': MappingProxyType(dict(device_counts.most_common(10)))
+        }
+    
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        """Статистика для пустого набора записей"""
+        return {
+            'total_records': 0,
+            'by_company': {},
+            'by_gender': {},
+            'by_age_group': {},
+            'by_device': {},
+            'by_event_type': {},
+            'by_user_list': {},
+            'with_images': 0,
+            'without_images': 0,
+            'score_distribution': {},
+            'hourly_distribution': {},
+            'top_users': _EMPTY_TOP,
+            'top_devices': _EMPTY_TOP
+        }
+    
+    @staticmethod
+    def _to_columns(records: Sequence[FaceRecord]) -> Dict[str, Any]:
+        """Колоночное представление записей: массив значений на каждое поле"""
+        # Длина известна: np.fromiter заполняет заранее выделенный массив
+        # без промежуточных кортежей-строк
+        count = len(records)
+        columns = {
+            name: np.fromiter(map(attrgetter(name), records), dtype=object, count=count)
+            for name in _STRING_FIELDS
+        }
+        # Сами base64 изображения не храним, только признак наличия
+        columns['has_image'] = np.fromiter(
+            (bool(record.image_base64) for record in records), dtype=bool, count=count
+        )
+        return columns
+    
+    @staticmethod
+    def _to_frame(records: Sequence[FaceRecord]) -> 'pd.DataFrame':
+        """Построить DataFrame из колонок записей"""
+        return pd.DataFrame(StatisticsAnalyzer._to_columns(records))
+    
+    @staticmethod
+    def _analyze_vectorized(records: Sequence[FaceRecord]) -> Dict[str, Any]:
+        """Векторизованный анализ через pandas"""
+        df = StatisticsAnalyzer._to_frame(records)
+        total = len(df)
+        
+        # Словарное кодирование колонок: счет по целым кодам вместо хеширования строк;
+        # счетчик устройств нужен и для топа
+        counts = {column: StatisticsAnalyzer._factorized_counts(df[column])
+                  for column, _ in _CATEGORY_COLUMNS}
+        user_counts = StatisticsAnalyzer._factorized_counts(df['user_name'])
+        
+        # Числовые колонки: разбор целиком, бакеты - одним общим проходом
+        age_counts, score_counts, with_images = StatisticsAnalyzer._fused_bucket_counts(
+            StatisticsAnalyzer._parse_ages_vectorized(df['age']),
+            StatisticsAnalyzer._parse_scores_vectorized(df['score']),
+            df['has_image'].to_numpy(dtype=bool)
+        )
+        
+        stats = {'total_records': total}
+        for column, key in _CATEGORY_COLUMNS:
+            uniques, column_counts = counts[column]
+            stats[key] = dict(zip(uniques.tolist(), column_counts.tolist()))
+        
+        stats.update({
+            'by_age_group': {label: int(c) for label, c in zip(_AGE_LABELS, age_counts) if c},
+            'with_images': with_images,
+            'without_images': total - with_images,
+            'score_distribution': {label: int(c) for label, c in zip(_SCORE_LABELS, score_counts) if c},
+            'hourly_distribution': StatisticsAnalyzer._hourly_vectorized(df['timestamp']),
+            'top_users': StatisticsAnalyzer._top_counts(*user_counts),
+            'top_devices': StatisticsAnalyzer._top_counts(*counts['device_id'])
+        })
+        
+        return stats
+    
+    @staticmethod
+    def _factorized_counts(values: 'pd.Series') -> Tuple[np.ndarray, np.ndarray]:
+        """Уникальные значения колонки в порядке появления и их количества"""
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        return np.asarray(uniques), np.bincount(codes, minlength=len(uniques))
+    
+    @staticmethod
+    def _top_counts(uniques: np.ndarray, counts: np.ndarray, limit: int = 10) -> Mapping[str, int]:
+        """Топ значений по количеству; при равенстве - в порядке появления, как most_common"""
+        order = np.argsort(-counts, kind='stable')[:limit]
+        return MappingProxyType(dict(zip(uniques[order].tolist(), counts[order].tolist())))
+    
+    @staticmethod
+    def _parse_ages_vectorized(ages: 'pd.Series') -> np.ndarray:
+        """Возрасты колонкой int64, 0 если неизвестен"""
+        # Как в _parse_age: только целое со знаком из цифр; '12.0', '1e2', 'inf' - неизвестный возраст
+        text = ages.astype(str).str.strip()
+        digits_only = text.str.fullmatch(r'[+-]?\d+').to_numpy(dtype=bool)
+        values = pd.to_numeric(text.where(digits_only), errors='coerce').to_numpy(dtype=np.float64)
+        return np.clip(np.nan_to_num(values, nan=0.0), -1000, 1000).astype(np.int64)
+    
+    @staticmethod
+    def _parse_scores_vectorized(scores: 'pd.Series') -> np.ndarray:
+        """Оценки колонкой float64 через строковые операции pandas, NaN если нет"""
+        # Убираем символы процента и пробелы во всей колонке сразу
+        cleaned = (scores.astype(str)
+                   .str.replace('%', '', regex=False)
+                   .str.replace(' ', '', regex=False))
+        # То же правило, что в _parse_score: 'Н/Д', '1e2', 'inf' и прочее превращаются в NaN
+        valid = cleaned.str.fullmatch(_SCORE_RE.pattern).to_numpy(dtype=bool)
+        return pd.to_numeric(cleaned.where(valid), errors='coerce').to_numpy(dtype=np.float64)
+    
+    @staticmethod
+    def _fused_bucket_counts(ages: np.ndarray, scores: np.ndarray,
+                             has_image: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Возрастные группы, диапазоны оценок и число фото за один проход"""
+        age_counts = np.zeros(len(_AGE_LABELS), dtype=np.int64)
+        score_counts = np.zeros(len(_SCORE_LABELS), dtype=np.int64)
+        
+        if _HAS_NUMBA and ages.size >= _PARALLEL_THRESHOLD:
+            # Частичные счетчики по потокам без общих записей, затем свертка
+            n_chunks = get_num_threads()
+            age_partial = np.zeros((n_chunks, len(_AGE_LABELS)), dtype=np.int64)
+            score_partial = np.zeros((n_chunks, len(_SCORE_LABELS)), dtype=np.int64)
+            image_partial = np.zeros((n_chunks, 1), dtype=np.int64)
+            _bucket_counts_parallel(ages, scores, has_image.view(np.uint8),
+                                    age_partial, score_partial, image_partial)
+            return age_partial.sum(axis=0), score_partial.sum(axis=0), int(image_partial.sum())
+        
+        if _HAS_NUMBA:
+            image_counts = np.zeros(1, dtype=np.int64)
+            _bucket_counts(ages, scores, has_image.view(np.uint8),
+                           age_counts, score_counts, image_counts)
+            return age_counts, score_counts, int(image_counts[0])
+        
+        # Без numba: общий id (возраст, оценка) и один np.bincount на обе гистограммы
+        age_ids = np.where(ages == 0, 0, np.digitize(ages, _AGE_BINS) + 1)
+        nd_mask = np.isnan(scores)
+        score_ids = np.where(nd_mask, 0, np.digitize(np.where(nd_mask, 0, scores), _SCORE_BINS) + 1)
+        
+        joint = np.bincount(age_ids * len(_SCORE_LABELS) + score_ids,
+                            minlength=len(_AGE_LABELS) * len(_SCORE_LABELS))
+        joint = joint.reshape(len(_AGE_LABELS), len(_SCORE_LABELS))
+        age_counts += joint.sum(axis=1)
+        score_counts += joint.sum(axis=0)
+        
+        return age_counts, score_counts, int(np.count_nonzero(has_image))
+    
+    @staticmethod
+    def _hourly_vectorized(timestamps: 'pd.Series') -> Dict[str, int]:
+        """Распределение по часам: срез для канонических строк, regex для остальных"""
+        timestamps = timestamps.astype(str)
+        canonical = timestamps.str.match(_TS_CANONICAL_RE).to_numpy(dtype=bool)
+        
+        hours = timestamps.str.slice(11, 13)
+        if not canonical.all():
+            other = ~canonical
+            hours[other] = timestamps[other].str.extract(_TS_RE, expand=False)
+        
+        return (hours.dropna() + ':00').value_counts().to_dict()
+    
+    @staticmethod
+    def _analyze_compiled(records: Sequence[FaceRecord]) -> Dict[str, Any]:
+        """Анализ без pandas: категории через Counter, числовые бакеты - ядром numba"""
+        columns = StatisticsAnalyzer._to_columns(records)
+        total = len(columns['has_image'])
+        
+        # Строковые колонки считаются в C (Counter поверх кортежа)
+        by_device = Counter(columns['device_id'])
+        top_users = Counter(columns['user_name'])
+        hourly_distribution = Counter(filter(None, map(_hour_label, columns['timestamp'])))
+        
+        # Числовые колонки разворачиваются в массивы для ядра numba
+        ages = np.array(list(map(_parse_age, columns['age'])), dtype=np.int64)
+        scores = np.array(list(map(_parse_score, columns['score'])), dtype=np.float64)
         
-        # Сортируем топы
-        stats['top_users'] = dict(sorted(stats['top_users'].items(), 
-                                        key=lambda x: x[1], reverse=True)[:10])
-        stats['top_devices'] = dict(sorted(stats['top_devices'].items(), 
-                                          key=lambda x: x[1], reverse=True)[:10])
+        age_counts, score_counts, with_images = StatisticsAnalyzer._fused_bucket_counts(
+            ages, scores, columns['has_image']
+        )
         
-        return stats
\ No newline at end of file
+        return {
+            'total_records': total,
+            'by_company': dict(Counter(columns['company_id'])),
+            'by_gender': dict(Counter(columns['gender'])),
+            'by_age_group': {label: int(c) for label, c in zip(_AGE_LABELS, age_counts) if c},
+            'by_device': dict(by_device),
+            'by_event_type': dict(Counter(columns['event_type'])),
+            'by_user_list': dict(Counter(columns['user_list'])),
+            'with_images': with_images,
+            'without_images': total - with_images,
+            'score_distribution': {label: int(c) for label, c in zip(_SCORE_LABELS, score_counts) if c},
+            'hourly_distribution': dict(hourly_distribution),
+            'top_users': MappingProxyType(dict(top_users.most_common(10))),
+            'top_devices': MappingProxyType(dict(by_device.most_common(10)))
+        }
\ No newline at end of file
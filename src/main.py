@@ -10,9 +10,12 @@ import sys
 import platform
 import asyncio
 import argparse
-import traceback
 import time
+import webbrowser
 import psutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple
 
 # Add modules path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -24,12 +27,7 @@ if parent_dir not in sys.path:
 
 # Import modules
 from core.config import Config
-from core.optimizer import (
-    run_comprehensive_optimization,
-    optimize_for_file_size,
-    get_system_optimizer,
-    get_memory_optimizer
-)
+from core.adaptive import AdaptiveController, quantize_batch
 from utils.logger import setup_logger
 from utils.helpers import (
     print_banner,
@@ -37,19 +35,118 @@ from utils.helpers import (
     select_formats,
     check_dependencies,
     ensure_directories,
+    preflight,
     get_available_memory_info,
     get_disk_space_info,
+    available_cpus,
     validate_file_path,
     cleanup_old_results
 )
-from core.processor import FaceRecognitionProcessor
-from core.optimized_processor import get_optimized_processor
+# core.optimizer, core.processor and core.optimized_processor pull in heavy
+# dependencies (numpy, PIL, cv2, aiohttp); they are imported lazily in main()
+# so that --help, --cleanup-old and the menu start fast
 
 # Setup logging
 logger = setup_logger()
 
-def parse_arguments():
-    """Parse command line arguments with extended options"""
+# Prime psutil CPU counter so later cpu_percent(interval=None) calls return
+# the load since this point without blocking the event loop
+psutil.cpu_percent(interval=None)
+
+
+@dataclass(frozen=True)
+class SystemFacts:
+    """Static system facts that do not change while the program runs"""
+    system: str
+    release: str
+    architecture: str
+    python_version: str
+    python_implementation: str
+    physical_cpus: int
+    logical_cpus: int
+    available_cpus: int
+    total_gb: float
+
+
+def _collect_system_facts() -> SystemFacts:
+    """Query platform and psutil once"""
+    try:
+        physical_cpus = psutil.cpu_count(logical=False)
+        logical_cpus = psutil.cpu_count(logical=True)
+    except:
+        physical_cpus = logical_cpus = None
+    try:
+        total_gb = psutil.virtual_memory().total / (1024**3)
+    except:
+        total_gb = 0.0
+    
+    return SystemFacts(
+        system=platform.system(),
+        release=platform.release(),
+        architecture=platform.architecture()[0],
+        python_version=platform.python_version(),
+        python_implementation=platform.python_implementation(),
+        physical_cpus=physical_cpus,
+        logical_cpus=logical_cpus,
+        available_cpus=available_cpus(),
+        total_gb=total_gb
+    )
+
+
+# Only available memory and load are dynamic; everything else is read from here
+SYS_FACTS = _collect_system_facts()
+_IS_WIN = SYS_FACTS.system == "Windows"
+
+# Tiers (threshold, value): batch size by file size in GB, workers by total RAM in GB
+_BATCH_TIERS = ((10, 1000), (5, 2000), (1, 4000))
+_WORKER_TIERS = ((4, 4), (8, 8), (16, 12))
+
+# Allowed ranges shared by the CLI options and the interactive prompts
+_BATCH_SIZE_RANGE = (100, 50000)
+_MAX_WORKERS_RANGE = (1, 30)
+_MEMORY_LIMIT_RANGE = (10, 95)
+_LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+_VALID_FORMATS = frozenset({'HTML', 'PDF', 'EXCEL', 'JSON'})
+
+# Resume discovery: result folder prefix and the "<folder><sep><checkpoint>" suffix
+_RESULTS_PREFIX = "results_"
+_CHECKPOINT_SUFFIX = os.sep + Config.CHECKPOINT_FILE
+
+# Preflight I/O backend: the inmem reader peaks at ~2x the file size
+# (raw bytes + decoded text while decoding; measured on a 110 MB JSONL file, LF and CRLF)
+_WORKING_SET_FACTOR = 2.0
+_INMEM_RAM_FRACTION = 0.7
+
+async def in_thread(func, *args):
+    """Run a blocking (interactive) helper in a worker thread so the event loop keeps running"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+async def ainput(prompt: str = "") -> str:
+    """input() in a worker thread so the event loop keeps running while waiting"""
+    return await in_thread(input, prompt)
+
+def ranged_int(lo: int, hi: int):
+    """argparse type: integer within [lo, hi]"""
+    def _parse(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{value!r} is not an integer")
+        if not lo <= number <= hi:
+            raise argparse.ArgumentTypeError(f"{number} not in [{lo}, {hi}]")
+        return number
+    return _parse
+
+
+def clamp(value: int, bounds: Tuple[int, int]) -> int:
+    """Clamp value into the (lo, hi) range"""
+    lo, hi = bounds
+    return max(lo, min(hi, value))
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser with extended options"""
     parser = argparse.ArgumentParser(
         description=f'Face Recognition Analytics Suite v{Config.VERSION}',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -70,11 +167,11 @@ Examples:
                        help='Path to file for processing')
     parser.add_argument('--formats', type=str,
                        help='Report formats separated by comma (html,pdf,excel,json)')
-    parser.add_argument('--batch-size', type=int,
+    parser.add_argument('--batch-size', type=ranged_int(*_BATCH_SIZE_RANGE),
                        help='Batch size for processing (max: 50000)')
-    parser.add_argument('--max-workers', type=int,
+    parser.add_argument('--max-workers', type=ranged_int(*_MAX_WORKERS_RANGE),
                        help='Maximum number of parallel workers (max: 30)')
-    parser.add_argument('--memory-limit', type=int,
+    parser.add_argument('--memory-limit', type=ranged_int(*_MEMORY_LIMIT_RANGE),
                        help='Maximum memory usage in percentage (10-95)')
     parser.add_argument('--skip-optimization', action='store_true',
                        help='Skip system optimization')
@@ -84,7 +181,7 @@ Examples:
                        help='Don\'t ask questions, use default values')
     parser.add_argument('--output-dir', type=str,
                        help='Custom results folder')
-    parser.add_argument('--log-level', type=str, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+    parser.add_argument('--log-level', type=str, choices=_LOG_LEVELS,
                        default='INFO', help='Log level')
     parser.add_argument('--benchmark', action='store_true',
                        help='Run performance test')
@@ -95,101 +192,121 @@ Examples:
     parser.add_argument('--show-menu', action='store_true',
                        help='Force show menu (default when no other arguments)')
     
-    return parser.parse_args()
+    return parser
+
+
+# Built once at import; parse_arguments only parses
+_PARSER = _build_parser()
+
+def parse_arguments():
+    """Parse command line arguments with extended options"""
+    return _PARSER.parse_args()
+
+class Printer:
+    """Buffer console lines and emit them with a single write"""
+    
+    def __init__(self):
+        self.buf = []
+    
+    def line(self, *args):
+        """Queue one line, joining arguments with spaces like print()"""
+        self.buf.append(" ".join(map(str, args)) + "\n")
+    
+    def flush(self):
+        sys.stdout.write("".join(self.buf))
+        sys.stdout.flush()
+        self.buf.clear()
+
 
 def print_system_info():
     """Print detailed system information"""
     memory_info = get_available_memory_info()
     disk_info = get_disk_space_info()
+    out = Printer()
     
-    print("📊 SYSTEM INFORMATION:")
-    print(f"   • OS: {platform.system()} {platform.release()}")
-    print(f"   • Architecture: {platform.architecture()[0]}")
-    print(f"   • Python: {platform.python_version()} ({platform.python_implementation()})")
+    out.line("📊 SYSTEM INFORMATION:")
+    out.line(f"   • OS: {SYS_FACTS.system} {SYS_FACTS.release}")
+    out.line(f"   • Architecture: {SYS_FACTS.architecture}")
+    out.line(f"   • Python: {SYS_FACTS.python_version} ({SYS_FACTS.python_implementation})")
     
     # Safely get CPU information
     try:
-        cpu_count = psutil.cpu_count(logical=False)
-        cpu_logical = psutil.cpu_count(logical=True)
-        cpu_percent = psutil.cpu_percent(interval=0.5)
-        print(f"   • CPU Cores: {cpu_count} physical, {cpu_logical} logical")
-        print(f"   • CPU Load: {cpu_percent:.1f}%")
+        cpu_percent = psutil.cpu_percent(interval=None)
+        out.line(f"   • CPU Cores: {SYS_FACTS.physical_cpus} physical, {SYS_FACTS.logical_cpus} logical")
+        out.line(f"   • CPU Load: {cpu_percent:.1f}%")
     except:
-        print("   • CPU: information unavailable")
+        out.line("   • CPU: information unavailable")
     
-    print(f"   • Memory: {memory_info['total_gb']:.1f} GB total")
-    print(f"   • Available: {memory_info['available_gb']:.1f} GB ({memory_info['percent']:.1f}% used)")
-    print(f"   • Disk: {disk_info['total_gb']:.1f} GB total")
-    print(f"   • Free: {disk_info['free_gb']:.1f} GB")
+    out.line(f"   • Memory: {SYS_FACTS.total_gb:.1f} GB total")
+    out.line(f"   • Available: {memory_info['available_gb']:.1f} GB ({memory_info['percent']:.1f}% used)")
+    out.line(f"   • Disk: {disk_info['total_gb']:.1f} GB total")
+    out.line(f"   • Free: {disk_info['free_gb']:.1f} GB")
     
     if memory_info['percent'] > 80:
-        print("   ⚠️  Warning: high memory usage!")
+        out.line("   ⚠️  Warning: high memory usage!")
     
-    print()
+    out.line()
+    out.flush()
 
 
 def get_adaptive_config():
     """Get adaptive configuration based on system resources"""
     memory_info = get_available_memory_info()
-    cpu_percent = psutil.cpu_percent(interval=0.5)
+    memory_percent = memory_info['percent']
+    initial_batch = Config.INITIAL_BATCH_SIZE
+    
+    # Headroom-proportional step instead of fixed load tiers: shrink near the memory cap,
+    # otherwise grow batch and workers in proportion to memory and CPU headroom
+    controller = AdaptiveController(
+        b_min=500,
+        b_max=_BATCH_SIZE_RANGE[1],
+        k_min=2,
+        k_max=max(2, min(Config.MAX_WORKERS, SYS_FACTS.available_cpus))
+    )
+    batch_size, max_workers = controller.propose({
+        'memory_percent': memory_percent,
+        'available_gb': memory_info['available_gb'],
+        'cpu_percent': psutil.cpu_percent(interval=None)
+    }, initial_batch, Config.MAX_WORKERS)
+    
+    # Leave more spare memory when the system is already loaded
+    memory_limit = Config.MAX_MEMORY_PERCENT
+    if memory_percent > 85:
+        memory_limit = 70
+    elif memory_percent > 70:
+        memory_limit = 80
+    
+    if batch_size < initial_batch:
+        print("   ⚠️  Little memory headroom - reducing load")
+    elif batch_size > initial_batch:
+        print("   ⚡ Resources available - increasing performance")
     
-    config = {
-        'batch_size': Config.INITIAL_BATCH_SIZE,
-        'max_workers': Config.MAX_WORKERS,
-        'memory_limit': Config.MAX_MEMORY_PERCENT
+    return {
+        'batch_size': batch_size,
+        'max_workers': max_workers,
+        'memory_limit': memory_limit
     }
-    
-    # Adapt based on memory load
-    if memory_info['percent'] > 85:
-        config['memory_limit'] = 70  # Reduce limit when high load
-        config['batch_size'] = max(Config.INITIAL_BATCH_SIZE // 2, 500)  # Reduce batch
-        config['max_workers'] = max(Config.MAX_WORKERS // 2, 4)  # Reduce workers
-        print("   ⚠️  High memory usage - reducing load")
-    elif memory_info['percent'] > 70:
-        config['memory_limit'] = 80
-        config['batch_size'] = max(Config.INITIAL_BATCH_SIZE // 1.5, 1000)
-        config['max_workers'] = max(Config.MAX_WORKERS // 1.5, 6)
-        print("   ⚠️  Medium memory load - moderate load reduction")
-    else:
-        # If system is idle, use more resources
-        if cpu_percent < 20 and memory_info['available_gb'] > 4:
-            config['batch_size'] = min(Config.INITIAL_BATCH_SIZE * 1.5, 15000)
-            config['max_workers'] = min(Config.MAX_WORKERS * 1.2, 20)
-            print("   ⚡ System is idle - increasing performance")
-    
-    # Adapt based on available memory
-    if memory_info['available_gb'] < 2:
-        config['batch_size'] = max(Config.INITIAL_BATCH_SIZE // 3, 500)
-        config['max_workers'] = max(Config.MAX_WORKERS // 3, 2)
-        print("   ⚠️  Low available memory - minimal load")
-    
-    return config
 
 def find_resume_file() -> str:
     """Find file to resume processing"""
     output_dir = Config.get_output_dir()
-    if not os.path.exists(output_dir):
-        return ""
-    
-    # Look for results folders
-    result_dirs = []
-    for item in os.listdir(output_dir):
-        item_path = os.path.join(output_dir, item)
-        if os.path.isdir(item_path) and item.startswith("results_"):
-            result_dirs.append(item_path)
     
-    if not result_dirs:
+    # Look for results folders; DirEntry caches type and stat from the directory read.
+    # The output folder is created at startup, so a missing folder is the rare case
+    try:
+        with os.scandir(output_dir) as entries:
+            result_dirs = [(entry.stat().st_mtime, entry.path) for entry in entries
+                           if entry.name.startswith(_RESULTS_PREFIX) and entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
         return ""
     
-    # Sort by modification time (most recent first)
-    result_dirs.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    
-    # Check for checkpoint in the latest folder
-    latest_dir = result_dirs[0]
-    checkpoint_file = os.path.join(latest_dir, "checkpoint.json")
-    
-    if os.path.exists(checkpoint_file):
-        return checkpoint_file
+    # Newest folders first; stop at the first one that holds a checkpoint
+    result_dirs.sort(reverse=True)
+    for _, result_dir in result_dirs:
+        # scandir paths have no trailing separator: plain concatenation instead of os.path.join
+        checkpoint_file = result_dir + _CHECKPOINT_SUFFIX
+        if os.path.exists(checkpoint_file):
+            return checkpoint_file
     
     return ""
 
@@ -202,31 +319,42 @@ async def interactive_setup(args):
     # File selection
     if args.file:
         input_file = args.file
-        if not os.path.exists(input_file):
-            print(f"❌ File not found: {input_file}")
-            return None
     else:
-        input_file = select_file()
+        input_file = await in_thread(select_file)
         if not input_file:
             print("❌ File not selected. Exiting.")
             return None
     
+    # Single stat call reused for validation and batch suggestion (--file was stat'ed in main)
+    st = args.file_stat if args.file else None
+    if st is None:
+        try:
+            st = os.stat(input_file)
+        except OSError:
+            print(f"❌ File not found: {input_file}")
+            return None
+    
     # File validation
-    is_valid, message = validate_file_path(input_file)
+    is_valid, message = validate_file_path(input_file, st=st)
     if not is_valid:
         print(f"❌ {message}")
         return None
     
+    # Pick the I/O backend once: whole-file read if the working set fits in RAM
+    working_set = st.st_size * _WORKING_SET_FACTOR
+    ram_cap = SYS_FACTS.total_gb * (1024**3) * _INMEM_RAM_FRACTION
+    backend = 'inmem' if working_set <= ram_cap else 'stream'
+    
     # Format selection
     if args.formats:
-        selected_formats = [f.strip().upper() for f in args.formats.split(',')]
-        valid_formats = ['HTML', 'PDF', 'EXCEL', 'JSON']
-        selected_formats = [f for f in selected_formats if f in valid_formats]
+        # Keep the user's order, drop unknown and repeated formats
+        requested = (f.strip() for f in args.formats.upper().split(','))
+        selected_formats = list(dict.fromkeys(f for f in requested if f in _VALID_FORMATS))
         if not selected_formats:
             print("❌ Invalid formats. Use: html, pdf, excel, json")
             return None
     else:
-        selected_formats = select_formats()
+        selected_formats = await in_thread(select_formats)
         if not selected_formats:
             print("❌ Formats not selected. Exiting.")
             return None
@@ -240,60 +368,43 @@ async def interactive_setup(args):
         if args.batch_size:
             batch_size = args.batch_size
         else:
-            file_size_gb = os.path.getsize(input_file) / (1024**3)
-            if file_size_gb > 10:
-                suggested_batch = 1000
-            elif file_size_gb > 5:
-                suggested_batch = 2000
-            elif file_size_gb > 1:
-                suggested_batch = 4000
-            else:
-                suggested_batch = 8000
+            file_size_gb = st.st_size / (1024**3)
+            suggested_batch = next((b for gb, b in _BATCH_TIERS if file_size_gb > gb), 8000)
             
-            try:
-                batch_input = input(f"Batch size [{suggested_batch}]: ").strip()
-                batch_size = int(batch_input) if batch_input else suggested_batch
-            except:
-                batch_size = suggested_batch
+            batch_input = (await ainput(f"Batch size [{suggested_batch}]: ")).strip()
+            batch_size = int(batch_input) if batch_input.isdigit() else suggested_batch
         
-        # Max workers
+        # Max workers; a value given by the user is kept as is during processing
+        workers_pinned = True
         if args.max_workers:
             max_workers = args.max_workers
         else:
-            memory_gb = psutil.virtual_memory().total / (1024**3)
-            if memory_gb < 4:
-                suggested_workers = 4
-            elif memory_gb < 8:
-                suggested_workers = 8
-            elif memory_gb < 16:
-                suggested_workers = 12
-            else:
-                suggested_workers = 16
+            memory_gb = SYS_FACTS.total_gb
+            suggested_workers = next((w for gb, w in _WORKER_TIERS if memory_gb < gb), 16)
+            # Do not oversubscribe the CPUs the process is allowed to use (containers, taskset)
+            suggested_workers = min(suggested_workers, SYS_FACTS.available_cpus)
             
-            try:
-                workers_input = input(f"Max parallel tasks [{suggested_workers}]: ").strip()
-                max_workers = int(workers_input) if workers_input else suggested_workers
-            except:
-                max_workers = suggested_workers
+            workers_input = (await ainput(f"Max parallel tasks [{suggested_workers}]: ")).strip()
+            workers_pinned = workers_input.isdigit()
+            max_workers = int(workers_input) if workers_pinned else suggested_workers
         
         # Memory limit
         if args.memory_limit:
             memory_limit = args.memory_limit
         else:
             suggested_limit = 85
-            try:
-                limit_input = input(f"Max memory usage % [{suggested_limit}]: ").strip()
-                memory_limit = int(limit_input) if limit_input else suggested_limit
-            except:
-                memory_limit = suggested_limit
-        
-        # Apply settings
-        if 100 <= batch_size <= 50000:
-            Config.INITIAL_BATCH_SIZE = batch_size
-        if 1 <= max_workers <= 30:
-            Config.MAX_WORKERS = max_workers
-        if 10 <= memory_limit <= 95:
-            Config.MAX_MEMORY_PERCENT = memory_limit
+            limit_input = (await ainput(f"Max memory usage % [{suggested_limit}]: ")).strip()
+            memory_limit = int(limit_input) if limit_input.isdigit() else suggested_limit
+        
+        # Apply settings (CLI values are already range-checked by argparse)
+        batch_size = clamp(batch_size, _BATCH_SIZE_RANGE)
+        max_workers = clamp(max_workers, _MAX_WORKERS_RANGE)
+        memory_limit = clamp(memory_limit, _MEMORY_LIMIT_RANGE)
+        # Every worker gets an equal share of the batch: no straggler shard at the batch boundary
+        batch_size = quantize_batch(batch_size, max_workers, _BATCH_SIZE_RANGE[0])
+        Config.INITIAL_BATCH_SIZE = batch_size
+        Config.MAX_WORKERS = max_workers
+        Config.MAX_MEMORY_PERCENT = memory_limit
         
         print(f"✅ Set: Batch={batch_size}, Workers={max_workers}, Memory={memory_limit}%")
     else:
@@ -302,22 +413,30 @@ async def interactive_setup(args):
         print("-"*80)
         
         adaptive_config = get_adaptive_config()
+        batch_size = adaptive_config['batch_size']
+        max_workers = args.max_workers or adaptive_config['max_workers']
+        memory_limit = adaptive_config['memory_limit']
+        workers_pinned = bool(args.max_workers)
         
         # Apply adaptive settings
-        Config.INITIAL_BATCH_SIZE = adaptive_config['batch_size']
-        Config.MAX_WORKERS = adaptive_config['max_workers']
-        Config.MAX_MEMORY_PERCENT = adaptive_config['memory_limit']
+        Config.INITIAL_BATCH_SIZE = batch_size
+        Config.MAX_WORKERS = max_workers
+        Config.MAX_MEMORY_PERCENT = memory_limit
         
         print(f"✅ Automatically configured:")
-        print(f"   • Batch size: {Config.INITIAL_BATCH_SIZE}")
-        print(f"   • Max workers: {Config.MAX_WORKERS}")
-        print(f"   • Memory limit: {Config.MAX_MEMORY_PERCENT}%")
+        print(f"   • Batch size: {batch_size}")
+        print(f"   • Max workers: {max_workers}")
+        print(f"   • Memory limit: {memory_limit}%")
     
     return {
         'input_file': input_file,
+        'file_size': st.st_size,
+        'file_mtime': st.st_mtime,
+        'backend': backend,
         'formats': selected_formats,
         'batch_size': Config.INITIAL_BATCH_SIZE,
         'max_workers': Config.MAX_WORKERS,
+        'workers_pinned': workers_pinned,
         'memory_limit': Config.MAX_MEMORY_PERCENT
     }
 
@@ -333,7 +452,7 @@ async def show_main_menu():
         print("4. ❌ Exit")
         print("="*80)
         
-        choice = input("\n👉 Select action (1-4): ").strip()
+        choice = (await ainput("\n👉 Select action (1-4): ")).strip()
         
         if choice == "1":
             return "new"
@@ -352,44 +471,42 @@ async def main():
     """Main function"""
     args = parse_arguments()
     
-    # Setup logging level
-    import logging
-    log_level = getattr(logging, args.log_level)
-    logger.setLevel(log_level)
-    
-    # Print system information
-    print_banner()
-    print_system_info()
+    # Setup logging with the level from the command line
+    setup_logger(level=args.log_level)
     
-    # Create required directories
-    ensure_directories()
+    # Fail fast on a stale --file before any setup; the stat result is reused later
+    args.file_stat = None
+    if args.file:
+        try:
+            args.file_stat = os.stat(args.file)
+        except OSError:
+            print(f"❌ File not found: {args.file}")
+            sys.exit(2)
     
-    # Check existence of main folders and create if needed
-    input_dir = Config.get_input_dir()
-    output_dir = Config.get_output_dir()
+    print_banner()
     
-    missing_dirs = []
-    if not os.path.exists(input_dir):
-        missing_dirs.append(f"Input data folder: {input_dir}")
-    if not os.path.exists(output_dir):
-        missing_dirs.append(f"Results folder: {output_dir}")
+    # System information (/proc, disk) and the directory preflight overlap instead of running
+    # back to back; system info is written in one buffered block, the preflight prints nothing.
+    # A system info failure is only logged: it is not a folder error and does not stop the program
+    system_info, manifest = await asyncio.gather(
+        in_thread(print_system_info),
+        preflight(Config.get_base_directories()),
+        return_exceptions=True
+    )
+    if isinstance(system_info, Exception):
+        logger.warning(f"System information unavailable: {system_info}")
     
-    if missing_dirs:
-        print("❌ Missing folders detected:")
-        for missing_dir in missing_dirs:
-            print(f"   • {missing_dir}")
-        print()
-        print("🔄 Creating missing folders...")
+    try:
+        if isinstance(manifest, Exception):
+            raise manifest
         
-        try:
-            os.makedirs(input_dir, exist_ok=True)
-            os.makedirs(output_dir, exist_ok=True)
-            print("✅ All required folders created successfully!")
-        except Exception as e:
-            print(f"❌ Error creating folders: {e}")
-            print("⚠️  Please create folders manually and restart the program")
-            input("Press Enter to exit...")
-            sys.exit(1)
+        # Create required directories (input and results folders) from the preflight manifest
+        await ensure_directories(manifest)
+    except Exception as e:
+        print(f"❌ Error creating folders: {e}")
+        print("⚠️  Please create folders manually and restart the program")
+        await ainput("Press Enter to exit...")
+        sys.exit(1)
     
     # Determine working mode
     mode = None
@@ -397,21 +514,27 @@ async def main():
         mode = "resume"
     elif args.cleanup_old:
         print("🧹 Cleaning old results...")
-        cleanup_old_results()
+        await in_thread(cleanup_old_results)
         return
     elif args.benchmark or args.optimize_only:
         print("❌ This function is no longer supported")
         return
-    elif args.new_processing:
+    elif args.new_processing or (args.file and not args.show_menu):
+        # --file alone means "process this file", not "show the menu"
         mode = "new"
-    elif args.show_menu or (not any([args.resume, args.cleanup_old, args.benchmark, args.optimize_only, args.new_processing])):
-        mode = await show_main_menu()
     else:
-        # If arguments are passed but no specific task is specified, show menu
         mode = await show_main_menu()
     
     # Обработка выбранного режима
     if mode == "new":
+        from core.optimizer import (
+            run_comprehensive_optimization,
+            optimize_for_file_size,
+            get_memory_optimizer
+        )
+        from core.processor import FaceRecognitionProcessor
+        from core.optimized_processor import get_optimized_processor
+        
         # Интерактивная настройка
         setup_result = await interactive_setup(args)
         if not setup_result:
@@ -420,8 +543,8 @@ async def main():
         input_file = setup_result['input_file']
         selected_formats = setup_result['formats']
         
-        # Получаем информацию о файле
-        file_size = os.path.getsize(input_file)
+        # Размер файла уже получен при настройке (один os.stat)
+        file_size = setup_result['file_size']
         file_size_gb = file_size / (1024**3)
         
         # Оптимизация под размер файла
@@ -436,25 +559,26 @@ async def main():
             print("⏭️  Пропуск оптимизации системы")
         
         # Проверка зависимостей
-        if not check_dependencies(selected_formats):
+        if not await in_thread(check_dependencies, selected_formats):
             if not args.no_interactive:
-                input("\nНажмите Enter для выхода...")
+                await ainput("\nНажмите Enter для выхода...")
             sys.exit(1)
         
-        # Вывод финальной конфигурации
-        print("\n" + "="*80)
-        print("🚀 ФИНАЛЬНАЯ КОНФИГУРАЦИЯ")
-        print("="*80)
-        print(f"📂 Файл: {os.path.basename(input_file)}")
-        print(f"📦 Размер: {file_size_gb:.2f} GB")
-        print(f"📄 Форматы: {', '.join(selected_formats)}")
-        print(f"🔄 Режим: НОВАЯ ОБРАБОТКА")
-        print(f"⚡ Производительность:")
-        print(f"   • Размер батча: {Config.INITIAL_BATCH_SIZE:,} записей")
-        print(f"   • Макс. рабочих: {Config.MAX_WORKERS}")
-        print(f"   • Лимит памяти: {Config.MAX_MEMORY_PERCENT}%")
-        print(f"   • Таймаут: {Config.REQUEST_TIMEOUT} сек")
-        print(f"   • Попыток: {Config.REQUEST_RETRIES}")
+        # Вывод финальной конфигурации одной записью
+        out = Printer()
+        out.line("\n" + "="*80)
+        out.line("🚀 ФИНАЛЬНАЯ КОНФИГУРАЦИЯ")
+        out.line("="*80)
+        out.line(f"📂 Файл: {os.path.basename(input_file)}")
+        out.line(f"📦 Размер: {file_size_gb:.2f} GB")
+        out.line(f"📄 Форматы: {', '.join(selected_formats)}")
+        out.line(f"🔄 Режим: НОВАЯ ОБРАБОТКА")
+        out.line(f"⚡ Производительность:")
+        out.line(f"   • Размер батча: {Config.INITIAL_BATCH_SIZE:,} записей")
+        out.line(f"   • Макс. рабочих: {Config.MAX_WORKERS}")
+        out.line(f"   • Лимит памяти: {Config.MAX_MEMORY_PERCENT}%")
+        out.line(f"   • Таймаут: {Config.REQUEST_TIMEOUT} сек")
+        out.line(f"   • Попыток: {Config.REQUEST_RETRIES}")
         
         # Оценка времени
         if file_size_gb > 10:
@@ -466,22 +590,24 @@ async def main():
         else:
             time_estimate = "5-30 минут"
         
-        print(f"⏱️  Ориентировочное время: {time_estimate}")
-        print("="*80)
+        out.line(f"⏱️  Ориентировочное время: {time_estimate}")
+        out.line("="*80)
+        out.flush()
         
         # Подтверждение запуска
         if not args.no_interactive:
-            confirm = input("\n👉 Начать обработку? (y/N): ").strip().lower()
+            confirm = (await ainput("\n👉 Начать обработку? (y/N): ")).strip().lower()
             if confirm != 'y':
                 print("❌ Обработка отменена.")
                 return
         
-        print("\n⏳ Начало обработки...")
-        print("   • Используется до 85% оперативной памяти")
-        print("   • Прогресс сохраняется каждые 100,000 записей")
-        print("   • При прерывании используйте --resume для продолжения")
-        print("   • Размер батча будет динамически настраиваться")
-        print("─" * 80)
+        out.line("\n⏳ Начало обработки...")
+        out.line("   • Используется до 85% оперативной памяти")
+        out.line("   • Прогресс сохраняется каждые 100,000 записей")
+        out.line("   • При прерывании используйте --resume для продолжения")
+        out.line("   • Размер батча будет динамически настраиваться")
+        out.line("─" * 80)
+        out.flush()
         
     elif mode == "resume":
         print("\n🔄 РЕЖИМ ВОЗОБНОВЛЕНИЯ ОБРАБОТКИ")
@@ -495,15 +621,34 @@ async def main():
             return
         
         print(f"📁 Найден файл для возобновления: {resume_file}")
-        confirm = input("👉 Продолжить обработку? (y/N): ").strip().lower()
+        confirm = (await ainput("👉 Продолжить обработку? (y/N): ")).strip().lower()
         if confirm != 'y':
             print("❌ Возобновление отменено.")
             return
         
-        # Запуск процесса возобновления
+        # Запуск процесса возобновления: входной файл берется из чекпоинта, результаты
+        # дописываются в ту же папку, где лежит чекпоинт
         try:
-            processor = FaceRecognitionProcessor([], resume=True)
-            success = await processor.resume_processing(resume_file)
+            from core.processor import FaceRecognitionProcessor
+            from core.checkpoint_manager import CheckpointManager
+            resume_dir = os.path.dirname(resume_file)
+            checkpoint = CheckpointManager(resume_dir).load_checkpoint()
+            if not checkpoint or not checkpoint.file_name:
+                print("❌ Чекпоинт поврежден или не содержит имени входного файла")
+                return
+            
+            input_file = os.path.join(Config.get_input_dir(), checkpoint.file_name)
+            if not os.path.isfile(input_file):
+                print(f"❌ Входной файл не найден: {input_file}")
+                return
+            
+            selected_formats = await in_thread(select_formats)
+            if not selected_formats:
+                print("❌ Форматы не выбраны.")
+                return
+            
+            processor = FaceRecognitionProcessor(selected_formats, resume=True)
+            success = await processor.process_file(input_file, output_dir=resume_dir)
             
             if success:
                 print("\n✅ Обработка успешно завершена!")
@@ -512,25 +657,45 @@ async def main():
                 
         except Exception as e:
             print(f"\n❌ Ошибка при возобновлении: {e}")
-            traceback.print_exc()
+            logger.exception("Resume failed")
         
         return
     
     elif mode == "cleanup":
         print("\n🗑️  ОЧИСТКА СТАРЫХ РЕЗУЛЬТАТОВ")
         print("="*80)
-        cleanup_old_results()
+        await in_thread(cleanup_old_results)
         print("✅ Очистка завершена!")
-        input("\nНажмите Enter для возврата в меню...")
+        await ainput("\nНажмите Enter для возврата в меню...")
         return
     
     # Создание и запуск процессора
+    executor = None
+    # Единый лимит одновременных загрузок: MAX_WORKERS после настройки, а не лимит по умолчанию.
+    # Лимит меняется вместе с MAX_WORKERS при адаптивной настройке во время обработки
+    from processing.image_processor import ResizableSemaphore, process_pool_size
+    download_semaphore = ResizableSemaphore(Config.MAX_WORKERS)
     try:
         # Используем оптимизированный процессор для максимальной производительности
         if selected_formats == ["HTML"]:  # Если только HTML, используем оптимизированный процессор
-            processor = get_optimized_processor(selected_formats, resume=args.resume)
+            # Обработка изображений - CPU-bound: пул процессов по тому же правилу, что и
+            # собственный пул обработчика изображений (доступные CPU и свободная память)
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            pool_workers = process_pool_size()
+            executor = ProcessPoolExecutor(
+                max_workers=pool_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            processor = get_optimized_processor(selected_formats, resume=args.resume, executor=executor,
+                                                backend=setup_result['backend'],
+                                                semaphore=download_semaphore,
+                                                executor_workers=pool_workers)
         else:
-            processor = FaceRecognitionProcessor(selected_formats, resume=args.resume)
+            processor = FaceRecognitionProcessor(selected_formats, resume=args.resume,
+                                                 backend=setup_result['backend'],
+                                                 semaphore=download_semaphore,
+                                                 pin_workers=setup_result['workers_pinned'])
         
         # Мониторинг памяти перед запуском
         memory_optimizer = get_memory_optimizer()
@@ -557,78 +722,89 @@ async def main():
                 print("="*80)
                 
                 if not args.no_interactive:
-                    choice = input("\n👉 Открыть HTML отчет в браузере? (y/N): ").strip().lower()
+                    choice = (await ainput("\n👉 Открыть HTML отчет в браузере? (y/N): ")).strip().lower()
                     if choice == 'y':
+                        # webbrowser сам выбирает способ для ОС и не ждет браузер; file:// URI
+                        # корректно кодирует пути с пробелами
                         try:
-                            if platform.system() == "Windows":
-                                os.startfile(html_report)
-                            elif platform.system() == "Darwin":
-                                os.system(f"open {html_report}")
-                            else:
-                                os.system(f"xdg-open {html_report}")
+                            opened = webbrowser.open(Path(html_report).resolve().as_uri())
+                        except (OSError, webbrowser.Error):
+                            opened = False
+                        if opened:
                             print("✅ Отчет открывается в браузере...")
-                        except:
+                        else:
                             print(f"📎 Отчет находится здесь: {html_report}")
         
-        # Отчет о производительности
-        print("\n" + "="*80)
-        print("📊 ОТЧЕТ О ПРОИЗВОДИТЕЛЬНОСТИ")
-        print("="*80)
-        
+        # Отчет о производительности: секции читаются один раз, вывод - одной записью
         performance_report = processor.get_performance_report()
-        
-        print(f"⏱️  Общее время обработки: {performance_report['processing']['processing_time_seconds']:.1f} сек")
-        print(f"⚡ Средняя скорость: {performance_report['processing']['records_per_second']:.0f} записей/сек")
-        print(f"📦 Обработано батчей: {performance_report['processing']['batches_processed']}")
-        print(f"📊 Финальный размер батча: {performance_report['processing']['final_batch_size']}")
-        print(f"🧠 Пиковое использование памяти: {performance_report['memory']['peak_memory_mb']:.1f} MB")
-        print(f"🖼️  Успешных фото: {performance_report['images']['valid']:,}")
-        print(f"📈 Успешность: {performance_report['images']['success_rate']:.1f}%")
-        print("="*80)
-        
-        print("\n" + "="*80)
-        print("✨ ОБРАБОТКА ЗАВЕРШЕНА!")
-        print("="*80)
+        proc = performance_report['processing']
+        mem = performance_report['memory']
+        images = performance_report['images']
+        
+        out = Printer()
+        out.line("\n" + "="*80)
+        out.line("📊 ОТЧЕТ О ПРОИЗВОДИТЕЛЬНОСТИ")
+        out.line("="*80)
+        out.line(f"⏱️  Общее время обработки: {proc['processing_time_seconds']:.1f} сек")
+        out.line(f"⚡ Средняя скорость: {proc['records_per_second']:.0f} записей/сек")
+        out.line(f"📦 Обработано батчей: {proc['batches_processed']}")
+        out.line(f"📊 Финальный размер батча: {proc['final_batch_size']}")
+        out.line(f"🧠 Пиковое использование памяти: {mem['peak_memory_mb']:.1f} MB")
+        out.line(f"🖼️  Успешных фото: {images['valid']:,}")
+        out.line(f"📈 Успешность: {images['success_rate']:.1f}%")
+        out.line("="*80)
+        out.line("\n" + "="*80)
+        out.line("✨ ОБРАБОТКА ЗАВЕРШЕНА!")
+        out.line("="*80)
+        out.flush()
         
     except KeyboardInterrupt:
         print("\n\n⚠️  Обработка прервана пользователем")
         print("💡 Для продолжения запустите программу с ключом --resume")
         if not args.no_interactive:
-            input("\nНажмите Enter для выхода...")
+            await ainput("\nНажмите Enter для выхода...")
     except Exception as e:
         print(f"\n💥 Критическая ошибка: {e}")
-        traceback.print_exc()
+        logger.exception("Critical error")
         if not args.no_interactive:
-            input("\nНажмите Enter для выхода...")
+            await ainput("\nНажмите Enter для выхода...")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
 
 def setup_asyncio_for_platform():
-    """Настройка asyncio для разных платформ"""
-    if platform.system() == "Windows":
-        if sys.version_info >= (3, 8):
-            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        else:
-            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-    else:
-        # Для Unix-систем используем uvloop если установлен
-        try:
-            import uvloop
-            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-            logger.info("Используется uvloop для улучшения производительности")
-        except ImportError:
-            pass
+    """Настройка asyncio для разных платформ, возвращает функцию запуска корутины"""
+    if _IS_WIN:
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        return asyncio.run
+    
+    # На Unix uvloop - обязательная зависимость, ставим до первого await
+    import uvloop
+    logger.info("Используется uvloop для улучшения производительности")
+    if tuple(int(part) for part in uvloop.__version__.split(".")[:2] if part.isdigit()) < (0, 19):
+        logger.warning(f"uvloop {uvloop.__version__} устарел, требуется >= 0.19")
+    
+    if sys.version_info >= (3, 11):
+        # Runner создает цикл uvloop напрямую: без политики и цикла по умолчанию
+        def run_with_runner(coro):
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                return runner.run(coro)
+        return run_with_runner
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run
 
 if __name__ == "__main__":
     try:
-        # Настройка asyncio
-        setup_asyncio_for_platform()
-        
-        # Check if help is requested first to avoid memory check
-        if len(sys.argv) == 2 and sys.argv[1] in ['-h', '--help']:
-            # Parse arguments to show help without memory check
+        # Check if help is requested first: no event loop setup and no memory check
+        if '-h' in sys.argv or '--help' in sys.argv:
+            # argparse prints help and exits; the finally block skips the Enter prompt
             parse_arguments()
-            # Exit immediately without going to finally block
             sys.exit(0)
         
+        # Настройка asyncio
+        run_event_loop = setup_asyncio_for_platform()
+        
         # Проверка версии Python
         if sys.version_info < (3, 7):
             print("❌ Требуется Python 3.7 или выше")
@@ -643,29 +819,15 @@ if __name__ == "__main__":
             sys.exit(1)
         
         # Запуск
-        asyncio.run(main())
+        run_event_loop(main())
         
     except KeyboardInterrupt:
         print("\n\n⚠️  Программа прервана пользователем")
         sys.exit(0)
     except Exception as e:
         print(f"\n💥 Необработанная ошибка: {e}")
-        traceback.print_exc()
+        logger.exception("Unhandled error")
         sys.exit(1)
     finally:
-        # Очистка временных файлов
-        try:
-            import tempfile
-            import glob
-            
-            # Удаляем временные файлы benchmark если есть
-            for temp_file in glob.glob('benchmark_temp*'):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        except:
-            pass
-        
         if not sys.flags.interactive and not ('--help' in sys.argv or '-h' in sys.argv):
             input("\nНажмите Enter для выхода...")
\ No newline at end of file
@@ -9,9 +9,12 @@ import hashlib
 import base64
 import gc
 import random
+import re
 import traceback
+import platform
 import ssl
 import json
+import struct
 from typing import Optional, Tuple, Dict, List, Any, Deque, NamedTuple
 from collections import deque, OrderedDict
 from concurrent.futures import ProcessPoolExecutor
@@ -28,15 +31,168 @@ import cv2
 from PIL import Image, ImageFile
 import psutil
 
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _TJ = TurboJPEG()
+    # Доступные коэффициенты масштабирования IDCT (1/8 ... 2), по возрастанию
+    _TJ_SCALES = sorted(_TJ.scaling_factors, key=lambda factor: factor[0] / factor[1])
+except (ImportError, OSError, RuntimeError):
+    # Нет PyTurboJPEG или системной libturbojpeg - JPEG через OpenCV
+    _TJ = None
+    _TJ_SCALES = []
+
+try:
+    # SIMD-кодирование base64 (AVX2/SSSE3), сразу в str
+    from pybase64 import b64encode_as_string as _b64encode_str
+except ImportError:
+    def _b64encode_str(data: bytes) -> str:
+        """Кодирование base64 в строку (стандартная библиотека)"""
+        return base64.b64encode(data).decode('ascii')
+
 from core.config import Config
 from core.models import ProcessingMetrics, FaceRecord, ImageMetrics
 from utils.logger import setup_logger
+from utils.helpers import available_cpus
 
 logger = setup_logger()
 
+_IS_WIN = platform.system() == "Windows"
+
 # Разрешаем обработку усеченных изображений
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+# Сигнатуры форматов изображений: поиск по префиксу заголовка фиксированной длины
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+    b'BM': 'BMP',
+    b'RIFF': 'WEBP',
+}
+_SIGNATURE_LENGTHS = tuple(sorted({len(sig) for sig in IMAGE_SIGNATURES}, reverse=True))
+# Маркеры JPEG (JFIF/EXIF) для файлов без стандартной сигнатуры в начале
+_JPEG_MARKER_RE = re.compile(rb'JFIF|Exif')
+
+# Размер куска чтения ответа: меньше итераций цикла, чем при 8 KB
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Сколько первых байт ответа нужно для проверки сигнатуры до конца загрузки
+SIGNATURE_PROBE_BYTES = 512
+
+# JPEG не больше этих пределов сохраняется без перекодирования
+JPEG_PASSTHROUGH_MAX_BYTES = 400 * 1024
+JPEG_PASSTHROUGH_MAX_SIDE = 2000
+
+# Оценка памяти одного spawn-процесса пула (интерпретатор, numpy/cv2, декодируемые кадры)
+PROCESS_MEMORY_MB = 256
+
+# Качество JPEG миниатюр для встраивания в HTML
+THUMBNAIL_QUALITY = 85
+THUMBNAIL_COMPRESSION_PARAMS = [
+    cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 1
+]
+
+
+def _dumps_line(data: Dict[str, Any]) -> bytes:
+    """Одна строка NDJSON"""
+    if _HAS_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def process_pool_size() -> int:
+    """Число процессов пула декодирования: одно ядро остается циклу событий, не больше MAX_WORKERS
+    и не больше, чем помещается в свободную память"""
+    memory_cap = psutil.virtual_memory().available // (PROCESS_MEMORY_MB * 1024**2)
+    size = max(1, min(available_cpus() - 1, Config.MAX_WORKERS, memory_cap))
+    if _IS_WIN:
+        size = min(size, 4)  # Ограничение для Windows
+    return size
+
+
+def _jpeg_orientation(image_data: bytes) -> int:
+    """Тег EXIF Orientation (1 - без поворота) по сегментам заголовка JPEG, без декодирования"""
+    try:
+        pos = 2
+        while image_data[pos] == 0xFF:
+            marker = image_data[pos + 1]
+            if marker in (0xD9, 0xDA):
+                break  # Конец заголовков - дальше сжатые данные
+            length = struct.unpack_from('>H', image_data, pos + 2)[0]
+            if marker == 0xE1 and image_data[pos + 4:pos + 10] == b'Exif\x00\x00':
+                tiff = pos + 10
+                order = '<' if image_data[tiff:tiff + 2] == b'II' else '>'
+                ifd = tiff + struct.unpack_from(order + 'I', image_data, tiff + 4)[0]
+                for i in range(struct.unpack_from(order + 'H', image_data, ifd)[0]):
+                    entry = ifd + 2 + 12 * i
+                    if struct.unpack_from(order + 'H', image_data, entry)[0] == 0x0112:
+                        orientation = struct.unpack_from(order + 'H', image_data, entry + 8)[0]
+                        return orientation if 1 <= orientation <= 8 else 1
+                return 1
+            pos += 2 + length
+    except (IndexError, struct.error):
+        pass  # Усеченный или нестандартный заголовок
+    return 1
+
+
+def _use_turbojpeg(image_data: bytes) -> bool:
+    """libjpeg-turbo не учитывает EXIF Orientation: повернутые снимки декодирует OpenCV"""
+    return _TJ is not None and _jpeg_orientation(image_data) == 1
+
+
+def _decode_bgr(image_data: bytes) -> Optional[np.ndarray]:
+    """Декодирование в BGR: JPEG через libjpeg-turbo (SIMD), остальные форматы через OpenCV"""
+    if _use_turbojpeg(image_data):
+        try:
+            return _TJ.decode(image_data, pixel_format=TJPF_BGR)
+        except OSError:
+            pass  # Не JPEG или поврежденный поток
+    return cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _fit_thumbnail(img: np.ndarray, thumbnail_size: Tuple[int, int]) -> np.ndarray:
+    """Уменьшение изображения до вписывания в размер миниатюры"""
+    height, width = img.shape[:2]
+    scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _decode_thumbnail(image_data: bytes, thumbnail_size: Tuple[int, int]) -> Optional[Tuple[np.ndarray, int, int]]:
+    """Миниатюра и исходные размеры; JPEG уменьшается прямо в IDCT без полного декодирования"""
+    if _use_turbojpeg(image_data):
+        try:
+            width, height = _TJ.decode_header(image_data)[:2]
+            # Маленькие картинки не увеличиваем: коэффициенты больше 1 в IDCT не используются
+            scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height, 1.0)
+            # Наименьший коэффициент, после которого картинка еще не меньше миниатюры
+            factor = next((f for f in _TJ_SCALES if scale <= f[0] / f[1] <= 1), (1, 1))
+            img = _TJ.decode(image_data, pixel_format=TJPF_BGR, scaling_factor=factor)
+            return _fit_thumbnail(img, thumbnail_size), width, height
+        except OSError:
+            pass  # Не JPEG или поврежденный поток
+    img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    return _fit_thumbnail(img, thumbnail_size), width, height
+
+
+def _encode_thumbnail(img: np.ndarray) -> Optional[bytes]:
+    """JPEG-кодирование миниатюры сразу в bytes (без копии буфера через tobytes)"""
+    if _TJ is not None:
+        return _TJ.encode(img, quality=THUMBNAIL_QUALITY, jpeg_subsample=TJSAMP_420)
+    success, buffer = cv2.imencode('.jpg', img, THUMBNAIL_COMPRESSION_PARAMS)
+    return buffer.tobytes() if success else None
+
 
 class ImageProcessingResult(NamedTuple):
     """Результат обработки изображения"""
@@ -51,7 +207,7 @@ class ImageCache:
     def __init__(self, max_size_mb: int = 200):
         self.max_size_bytes = max_size_mb * 1024 * 1024
         self.current_size_bytes = 0
-        self.cache = OrderedDict()  # Для сохранения порядка использования
+        self.cache = OrderedDict()  # key -> (data, size), порядок использования
         self.hits = 0
         self.misses = 0
         self.evictions = 0
@@ -64,7 +220,7 @@ class ImageCache:
         
         # Проверяем TTL (в этом простом кэше TTL не реализован,
         # но можно добавить при необходимости)
-        data = self.cache[key]
+        data, _ = self.cache[key]
         # Перемещаем в конец (сделали недавно использованным)
         self.cache.move_to_end(key)
         
@@ -80,10 +236,9 @@ class ImageCache:
             return False
         
         # Если ключ уже существует, удаляем старое значение
-        if key in self.cache:
-            old_data = self.cache[key]
-            self.current_size_bytes -= len(old_data)
-            self.cache.pop(key)
+        old_entry = self.cache.pop(key, None)
+        if old_entry is not None:
+            self.current_size_bytes -= old_entry[1]
         
         # Освобождаем место если нужно
         while (self.current_size_bytes + data_size > self.max_size_bytes 
@@ -92,7 +247,7 @@ class ImageCache:
         
         # Добавляем только если есть место
         if self.current_size_bytes + data_size <= self.max_size_bytes:
-            self.cache[key] = data
+            self.cache[key] = (data, data_size)
             self.current_size_bytes += data_size
             return True
         
@@ -103,10 +258,9 @@ class ImageCache:
         if not self.cache:
             return
         
-        oldest_key = next(iter(self.cache))
-        oldest_data = self.cache[oldest_key]
-        del self.cache[oldest_key]
-        self.current_size_bytes -= len(oldest_data)
+        # Размер запомнен при вставке - O(1) без повторного len()
+        _, (_, oldest_size) = self.cache.popitem(last=False)
+        self.current_size_bytes -= oldest_size
         self.evictions += 1
     
     def clear(self):
@@ -168,6 +322,55 @@ class DownloadDiagnostics:
         }
 
 
+class ResizableSemaphore:
+    """Семафор с изменяемым лимитом: счетчик занятых мест под asyncio.Condition"""
+    
+    def __init__(self, limit: int):
+        self._limit = max(1, limit)
+        self._active = 0
+        self._cond = asyncio.Condition()
+        # Ссылки на задачи пробуждения: цикл событий хранит только слабые ссылки на задачи
+        self._notify_tasks: set = set()
+    
+    @property
+    def limit(self) -> int:
+        return self._limit
+    
+    async def acquire(self):
+        """Занять место, дождавшись пока занятых станет меньше лимита"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+    
+    async def release(self):
+        """Освободить место и разбудить одного ожидающего"""
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify()
+    
+    async def _notify_all(self):
+        async with self._cond:
+            self._cond.notify_all()
+    
+    def resize(self, limit: int):
+        """Новый лимит: уменьшение действует на следующие захваты, увеличение будит ожидающих"""
+        limit = max(1, limit)
+        grew = limit > self._limit
+        self._limit = limit
+        if grew:
+            # notify_all требует захваченной блокировки условия - будим из отдельной задачи
+            task = asyncio.ensure_future(self._notify_all())
+            self._notify_tasks.add(task)
+            task.add_done_callback(self._notify_tasks.discard)
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return None
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+
 class RetryStrategy:
     """Стратегия повторных попыток с экспоненциальной задержкой"""
     
@@ -225,7 +428,16 @@ class ImageProcessorWithEmbedding:
     - Безопасное SSL соединение
     """
     
-    def __init__(self, base_dir: str):
+    # Период (в обработанных изображениях) сборки мусора молодых поколений
+    GC_INTERVAL = 256
+    # Файл метрик (NDJSON, по строке на изображение) и число последних метрик в памяти
+    METRICS_FILE = "image_metrics.jsonl"
+    METRICS_TAIL = 100
+    # Задач в пуле процессов (выполняемых и ожидающих) на один процесс
+    DECODE_QUEUE_FACTOR = 2
+    
+    def __init__(self, base_dir: str, executor: Optional[ProcessPoolExecutor] = None,
+                 semaphore: Optional[ResizableSemaphore] = None, executor_workers: Optional[int] = None):
         self.base_dir = base_dir
         self.config = ProcessingConfig()
         
@@ -244,18 +456,37 @@ class ImageProcessorWithEmbedding:
         self.disk_cache_dir = os.path.join(base_dir, Config.CACHE_FOLDER)
         self.images_dir = os.path.join(base_dir, Config.IMAGE_FOLDER)
         
-        # Пул процессов для CPU-bound операций (оптимально для Windows)
-        max_processes = min(multiprocessing.cpu_count() - 1, 4)  # Ограничение для Windows
-        self.process_pool = ProcessPoolExecutor(
-            max_workers=max_processes,
-            mp_context=multiprocessing.get_context('spawn')  # Для Windows
-        )
-        
-        # Семафор для ограничения одновременных загрузок
-        self.download_semaphore = asyncio.Semaphore(self.config.max_connections)
+        # Пул процессов для CPU-bound операций (оптимально для Windows).
+        # Внешний пул принадлежит вызывающему коду и здесь не завершается
+        # Число процессов запоминаем при создании пула; для внешнего пула его передает вызывающий код
+        self._owns_process_pool = executor is None
+        if executor is not None:
+            self.process_pool = executor
+            self.pool_workers = executor_workers or available_cpus()
+        else:
+            self.pool_workers = process_pool_size()
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.pool_workers,
+                mp_context=multiprocessing.get_context('spawn')  # Для Windows
+            )
         
-        # Статистика
-        self.metrics: List[ImageMetrics] = []
+        # Семафор для ограничения одновременных загрузок; внешний задает общий лимит приложения
+        self.download_semaphore = semaphore or ResizableSemaphore(self.config.max_connections)
+        
+        # Очередь к пулу процессов: не больше DECODE_QUEUE_FACTOR задач на процесс. Загрузки
+        # продолжаются, пока скачанные изображения ждут декодирования, а память ограничена
+        self.decode_capacity = self.pool_workers * self.DECODE_QUEUE_FACTOR
+        self.decode_slots = asyncio.Semaphore(self.decode_capacity)
+        
+        # Статистика: метрики пишутся в файл по мере обработки, в памяти - счетчики
+        # и последние METRICS_TAIL записей для отладки
+        self.metrics: Deque[ImageMetrics] = deque(maxlen=self.METRICS_TAIL)
+        self._metrics_fp = None
+        self.images_total = 0
+        self.images_successful = 0
+        self.images_cached = 0
+        self._success_download_ms = 0
+        self._success_size_kb = 0.0
         self.processing_times: Deque[float] = deque(maxlen=1000)
         self.total_processed = 0
         self.total_download_time = 0.0
@@ -263,6 +494,11 @@ class ImageProcessorWithEmbedding:
         # Создание необходимых директорий
         self._create_directories()
         
+        # Индекс сохраненных файлов: проверка без обращений к диску на каждое изображение
+        self._saved_photos: Dict[str, str] = {}
+        self._cached_hashes = set()
+        self._index_saved_images()
+        
         # Компрессионные параметры
         self.compression_params = [
             cv2.IMWRITE_JPEG_QUALITY, self.config.compression_quality,
@@ -280,8 +516,7 @@ class ImageProcessorWithEmbedding:
             ssl_context.verify_mode = ssl.CERT_REQUIRED
             
             # Для Windows добавляем дополнительные корневые сертификаты
-            import platform
-            if platform.system() == "Windows":
+            if _IS_WIN:
                 # Windows хранит сертификаты в системном хранилище
                 ssl_context.load_default_certs()
             
@@ -323,6 +558,20 @@ class ImageProcessorWithEmbedding:
         os.makedirs(self.disk_cache_dir, exist_ok=True)
         os.makedirs(os.path.join(self.base_dir, Config.TEMP_FOLDER), exist_ok=True)
     
+    def _index_saved_images(self):
+        """Однократный обход папок фото и кэша: хэш URL -> путь к оригиналу, хэши в кэше"""
+        with os.scandir(self.images_dir) as entries:
+            for entry in entries:
+                # photo_<hash>_<timestamp>.jpg
+                parts = entry.name.split('_')
+                if len(parts) == 3 and parts[0] == 'photo':
+                    self._saved_photos.setdefault(parts[1], entry.path)
+        with os.scandir(self.disk_cache_dir) as entries:
+            for entry in entries:
+                # cache_<hash>.jpg
+                if entry.name.startswith('cache_') and entry.name.endswith('.jpg'):
+                    self._cached_hashes.add(entry.name[6:-4])
+    
     async def __aenter__(self):
         """Контекстный менеджер"""
         await self._initialize_session()
@@ -345,11 +594,13 @@ class ImageProcessorWithEmbedding:
                 sock_connect=5
             )
             
+            # Соединения переиспользуются (keep-alive): без TCP/TLS рукопожатия на каждое изображение
             self.connector = aiohttp.TCPConnector(
                 limit=self.config.max_connections,
-                limit_per_host=8,
+                limit_per_host=20,
                 ttl_dns_cache=300,
-                force_close=True,
+                force_close=False,
+                keepalive_timeout=30,
                 enable_cleanup_closed=True,
                 ssl=self.ssl_context  # Используем безопасный SSL контекст
             )
@@ -383,8 +634,8 @@ class ImageProcessorWithEmbedding:
                 self.session = None
                 logger.debug("HTTP сессия закрыта")
             
-            # Завершение пула процессов
-            if hasattr(self, 'process_pool'):
+            # Завершение пула процессов (только собственного)
+            if hasattr(self, 'process_pool') and self._owns_process_pool:
                 self.process_pool.shutdown(wait=True)
                 logger.debug("Пул процессов завершен")
             
@@ -403,18 +654,54 @@ class ImageProcessorWithEmbedding:
         except Exception as e:
             logger.error(f"Ошибка при закрытии ресурсов: {e}")
     
+    def _record_metric(self, metric: ImageMetrics):
+        """Учет метрики изображения: счетчики сводки и строка в файле метрик"""
+        self.metrics.append(metric)
+        self.images_total += 1
+        if metric.is_cached:
+            self.images_cached += 1
+        if metric.success:
+            self.images_successful += 1
+            self._success_download_ms += metric.download_time_ms
+            self._success_size_kb += metric.size_kb
+        
+        try:
+            if self._metrics_fp is None:
+                self._metrics_fp = open(os.path.join(self.disk_cache_dir, self.METRICS_FILE), 'wb')
+            self._metrics_fp.write(_dumps_line(metric.to_dict()))
+        except OSError as e:
+            logger.debug(f"Ошибка записи метрики: {e}")
+    
+    def _metric_totals(self) -> Dict[str, Any]:
+        """Сводные показатели по накопленным счетчикам"""
+        successful = self.images_successful
+        
+        if self.processing_times:
+            avg_processing_time = sum(self.processing_times) / len(self.processing_times)
+        else:
+            avg_processing_time = 0
+        
+        return {
+            "successful": successful,
+            "failed": self.images_total - successful,
+            "success_rate": (successful / self.images_total * 100) if self.images_total else 0,
+            "total_download_time_seconds": self.total_download_time,
+            "avg_download_time_ms": (self._success_download_ms / successful) if successful else 0,
+            "avg_processing_time_ms": avg_processing_time * 1000,
+            "avg_image_size_kb": (self._success_size_kb / successful) if successful else 0,
+            "memory_cache_stats": self.memory_cache.get_stats()
+        }
+    
     async def _save_metrics(self):
         """Сохранение метрик обработки изображений"""
-        if not self.metrics:
+        if self._metrics_fp is not None:
+            self._metrics_fp.close()
+            self._metrics_fp = None
+        
+        if not self.images_total:
             return
         
         try:
-            metrics_file = os.path.join(self.disk_cache_dir, "image_metrics.json")
-            metrics_data = [metric.to_dict() for metric in self.metrics]
-            
-            async with aiofiles.open(metrics_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(metrics_data, indent=2, ensure_ascii=False))
-            
             # Сохранение сводной статистики
             await self._save_summary_statistics()
             
@@ -424,25 +711,10 @@ class ImageProcessorWithEmbedding:
     async def _save_summary_statistics(self):
         """Сохранение сводной статистики"""
         try:
-            successful = [m for m in self.metrics if m.success]
-            failed = [m for m in self.metrics if not m.success]
-            
-            if self.processing_times:
-                avg_processing_time = sum(self.processing_times) / len(self.processing_times)
-            else:
-                avg_processing_time = 0
-            
             summary = {
-                "total_images": len(self.metrics),
-                "successful": len(successful),
-                "failed": len(failed),
-                "success_rate": (len(successful) / len(self.metrics) * 100) if self.metrics else 0,
-                "total_download_time_seconds": self.total_download_time,
-                "avg_download_time_ms": (sum(m.download_time_ms for m in successful) / len(successful)) if successful else 0,
-                "avg_processing_time_ms": avg_processing_time * 1000,
-                "cached_images": sum(1 for m in self.metrics if m.is_cached),
-                "avg_image_size_kb": (sum(m.size_kb for m in successful) / len(successful)) if successful else 0,
-                "memory_cache_stats": self.memory_cache.get_stats(),
+                "total_images": self.images_total,
+                "cached_images": self.images_cached,
+                **self._metric_totals(),
                 "timestamp": time.time()
             }
             
@@ -453,13 +725,10 @@ class ImageProcessorWithEmbedding:
         except Exception as e:
             logger.error(f"Ошибка сохранения сводной статистики: {e}")
     
-    def _generate_image_name(self, url: str) -> Tuple[str, str, str]:
-        """Генерация уникальных имен файлов"""
+    def _generate_image_name(self, url: str) -> Tuple[str, str]:
+        """Хэш URL и имя файла кэша (имя оригинала с меткой времени задает обработчик)"""
         url_hash = hashlib.md5(url.encode()).hexdigest()
-        timestamp = int(time.time() * 1000)
-        filename = f"photo_{url_hash}_{timestamp}.jpg"
-        cache_filename = f"cache_{url_hash}.jpg"
-        return url_hash, filename, cache_filename
+        return url_hash, f"cache_{url_hash}.jpg"
     
     @staticmethod
     def _validate_image_data(data: bytes) -> Tuple[bool, str]:
@@ -467,22 +736,15 @@ class ImageProcessorWithEmbedding:
         if len(data) < 100:
             return False, "File too small (<100 bytes)"
         
-        # Проверка сигнатур изображений
-        signatures = [
-            (b'\xff\xd8\xff', 'JPEG'),
-            (b'\x89PNG\r\n\x1a\n', 'PNG'),
-            (b'GIF87a', 'GIF'),
-            (b'GIF89a', 'GIF'),
-            (b'BM', 'BMP'),
-            (b'RIFF', 'WEBP'),
-        ]
-        
-        for sig, file_type in signatures:
-            if data.startswith(sig):
+        # Проверка сигнатур изображений: несколько поисков в словаре по префиксам заголовка
+        head = bytes(data[:_SIGNATURE_LENGTHS[0]])
+        for length in _SIGNATURE_LENGTHS:
+            file_type = IMAGE_SIGNATURES.get(head[:length])
+            if file_type:
                 return True, file_type
         
-        # Попробуем определить по заголовкам
-        if b'JFIF' in data[:100] or b'Exif' in data[:100]:
+        # Попробуем определить по заголовкам: один проход по первым 100 байтам без копии
+        if _JPEG_MARKER_RE.search(data, 0, 100):
             return True, "JPEG"
         
         return False, "Invalid image format"
@@ -511,28 +773,43 @@ class ImageProcessorWithEmbedding:
                             return None
                         
                         # Читаем данные с ограничением по размеру
+                        # Куски собираются в список и склеиваются один раз: без перевыделений
+                        # растущего буфера и без отдельной копии bytes(...) в конце
                         max_size = self.config.max_image_size_mb * 1024 * 1024
-                        data = bytearray()
+                        chunks = []
+                        size = 0
+                        file_type = None
                         
-                        async for chunk in response.content.iter_chunked(8192):
-                            data.extend(chunk)
-                            if len(data) > max_size:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            chunks.append(chunk)
+                            size += len(chunk)
+                            if size > max_size:
                                 diagnostics.add_error(f"File too large (> {self.config.max_image_size_mb}MB)")
                                 return None
+                            
+                            # Сигнатура проверяется по началу ответа: HTML-страница или другой
+                            # не-графический ответ не скачивается целиком
+                            if file_type is None and size >= SIGNATURE_PROBE_BYTES:
+                                is_valid, file_type = self._validate_image_data(b''.join(chunks))
+                                if not is_valid:
+                                    diagnostics.add_error(f"Invalid image format ({file_type})")
+                                    return None
                         
-                        diagnostics.size_bytes = len(data)
+                        data = b''.join(chunks)
+                        diagnostics.size_bytes = size
                         diagnostics.response_time_ms = (time.time() - start_time) * 1000
                         
-                        # Валидация изображения
-                        is_valid, file_type = self._validate_image_data(bytes(data))
-                        if not is_valid:
-                            diagnostics.add_error(f"Invalid image format ({file_type})")
-                            return None
+                        # Валидация короткого ответа, не дошедшего до порога проверки
+                        if file_type is None:
+                            is_valid, file_type = self._validate_image_data(data)
+                            if not is_valid:
+                                diagnostics.add_error(f"Invalid image format ({file_type})")
+                                return None
                         
                         diagnostics.file_type = file_type
                         diagnostics.success = True
                         
-                        return bytes(data)
+                        return data
                         
             except asyncio.TimeoutError:
                 diagnostics.add_error("Timeout")
@@ -571,7 +848,7 @@ class ImageProcessorWithEmbedding:
             return ImageProcessingResult("", "", {"failed_reason": "Invalid URL"})
         
         start_time = time.time()
-        url_hash, filename, cache_filename = self._generate_image_name(url)
+        url_hash, cache_filename = self._generate_image_name(url)
         
         # Создание метрики для отслеживания
         image_metric = ImageMetrics(
@@ -586,15 +863,20 @@ class ImageProcessorWithEmbedding:
             success=False
         )
         
-        # Шаг 1: Проверка кэша на диске
-        cache_path = os.path.join(self.disk_cache_dir, cache_filename)
-        if os.path.exists(cache_path):
+        # Шаг 1: Проверка кэша на диске, затем ранее сохраненного оригинала (по индексу в памяти):
+        # уже обработанное изображение не декодируется и не перезаписывается повторно
+        filepath = self._saved_photos.get(url_hash, "")
+        if url_hash in self._cached_hashes:
+            source_path = os.path.join(self.disk_cache_dir, cache_filename)
+        else:
+            source_path = filepath
+        if source_path:
             try:
-                result = await self._load_from_cache(cache_path, url_hash)
+                result = await self._load_from_cache(source_path, filepath)
                 if result:
                     metrics.cached_images += 1
                     self._update_image_metric(image_metric, True, result[2], 0)
-                    self.metrics.append(image_metric)
+                    self._record_metric(image_metric)
                     return result
             except Exception as e:
                 logger.debug(f"Cache read error: {e}")
@@ -605,9 +887,10 @@ class ImageProcessorWithEmbedding:
             try:
                 result = await self._process_cached_data(cached_data, url_hash)
                 if result:
+                    self._saved_photos[url_hash] = result[0]
                     metrics.cached_images += 1
                     self._update_image_metric(image_metric, True, result[2], 0)
-                    self.metrics.append(image_metric)
+                    self._record_metric(image_metric)
                     return result
             except Exception as e:
                 logger.debug(f"Memory cache processing error: {e}")
@@ -626,6 +909,7 @@ class ImageProcessorWithEmbedding:
             processing_time = time.time() - process_start
             
             if result and result[0] and result[1]:  # filepath и base64_str не пустые
+                self._saved_photos[url_hash] = result[0]
                 metrics.valid_images += 1
                 download_time = (time.time() - download_start) * 1000
                 self.total_download_time += time.time() - download_start
@@ -638,15 +922,20 @@ class ImageProcessorWithEmbedding:
                     processing_time * 1000
                 )
                 
-                self.metrics.append(image_metric)
-                gc.collect()
+                self._record_metric(image_metric)
+                
+                # Буферы изображения освобождаются по счетчику ссылок; полный проход GC
+                # на каждое изображение не нужен - только молодые поколения раз в GC_INTERVAL
+                self.total_processed += 1
+                if self.total_processed % self.GC_INTERVAL == 0:
+                    gc.collect(1)
                 
                 return result
             else:
                 # Изображение загружено, но не обработано
                 error_msg = "Failed to process image data"
                 self._update_image_metric(image_metric, False, {"failed_reason": error_msg}, 0)
-                self.metrics.append(image_metric)
+                self._record_metric(image_metric)
                 metrics.failed_images += 1
                 
                 return ImageProcessingResult("", "", {
@@ -661,7 +950,7 @@ class ImageProcessorWithEmbedding:
                 error_msg = f"HTTP {diagnostics.status_code}: {error_msg}"
             
             self._update_image_metric(image_metric, False, {"failed_reason": error_msg}, 0)
-            self.metrics.append(image_metric)
+            self._record_metric(image_metric)
             metrics.failed_images += 1
             
             if diagnostics.status_code in [404, 403, 500]:
@@ -673,80 +962,28 @@ class ImageProcessorWithEmbedding:
                 "diagnostics": diagnostics.to_dict()
             })
     
-    async def _load_from_cache(self, cache_path: str, url_hash: str) -> Optional[ImageProcessingResult]:
-        """Загрузка изображения из кэша на диске"""
-        loop = asyncio.get_event_loop()
-        
-        def read_and_process():
-            try:
-                with open(cache_path, 'rb') as f:
-                    img_data = f.read()
-                
-                # Обработка для создания thumbnail
-                nparr = np.frombuffer(img_data, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if img is not None:
-                    height, width = img.shape[:2]
-                    
-                    # Создание миниатюры
-                    thumbnail_size = self.config.thumbnail_size
-                    if width > thumbnail_size[0] or height > thumbnail_size[1]:
-                        scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height)
-                        new_width = int(width * scale)
-                        new_height = int(height * scale)
-                        img_resized = cv2.resize(img, (new_width, new_height), cv2.INTER_AREA)
-                    else:
-                        img_resized = img
-                    
-                    success, buffer = cv2.imencode('.jpg', img_resized, [
-                        cv2.IMWRITE_JPEG_QUALITY, 85,
-                        cv2.IMWRITE_JPEG_OPTIMIZE, 1
-                    ])
-                    
-                    if success:
-                        base64_str = base64.b64encode(buffer.tobytes()).decode('utf-8')
-                        
-                        # Поиск оригинального файла
-                        import glob
-                        check_pattern = f"photo_{url_hash}_*.jpg"
-                        existing = glob.glob(os.path.join(self.images_dir, check_pattern))
-                        filepath = existing[0] if existing else ""
-                        
-                        return ImageProcessingResult(
-                            filepath=filepath,
-                            base64_str=base64_str,
-                            image_info={
-                                "width": width,
-                                "height": height,
-                                "file_size_kb": len(img_data) / 1024,
-                                "from_cache": True
-                            }
-                        )
-            except Exception as e:
-                logger.debug(f"Error reading from disk cache: {e}")
-            
-            return None
-        
-        return await loop.run_in_executor(self.process_pool, read_and_process)
+    async def _load_from_cache(self, source_path: str, filepath: str) -> Optional[ImageProcessingResult]:
+        """Миниатюра из кэша на диске или из ранее сохраненного оригинала (без перезаписи файлов)"""
+        return await self._run_in_pool(
+            _load_thumbnail_sync,
+            source_path,
+            self.config.thumbnail_size,
+            filepath
+        )
+    
+    async def _run_in_pool(self, func, *args):
+        """Выполнить CPU-задачу в пуле процессов, дождавшись места в очереди к пулу"""
+        async with self.decode_slots:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.process_pool, func, *args)
     
     async def _process_cached_data(self, image_data: bytes, url_hash: str) -> Optional[ImageProcessingResult]:
         """Обработка данных из кэша памяти"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.process_pool,
-            _process_image_sync_static,
-            image_data,
-            url_hash,
-            self.images_dir,
-            self.compression_params
-        )
+        return await self._process_image_data(image_data, url_hash)
     
     async def _process_image_data(self, image_data: bytes, url_hash: str) -> Optional[ImageProcessingResult]:
         """Асинхронная обработка данных изображения"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.process_pool,
+        return await self._run_in_pool(
             _process_image_sync_static,
             image_data,
             url_hash,
@@ -773,104 +1010,141 @@ class ImageProcessorWithEmbedding:
     
     def get_statistics(self) -> Dict[str, Any]:
         """Получить статистику обработчика изображений"""
-        successful = [m for m in self.metrics if m.success]
+        return {
+            "total_processed": self.images_total,
+            "cached_count": self.images_cached,
+            **self._metric_totals()
+        }
+
+
+def _load_thumbnail_sync(source_path: str, thumbnail_size: Tuple[int, int],
+                         filepath: str) -> Optional[ImageProcessingResult]:
+    """Миниатюра из файла на диске (выполняется в отдельном процессе)"""
+    try:
+        with open(source_path, 'rb') as f:
+            img_data = f.read()
         
-        if self.processing_times:
-            avg_processing_time = sum(self.processing_times) / len(self.processing_times)
-        else:
-            avg_processing_time = 0
+        # JPEG декодируется сразу в уменьшенном виде
+        decoded = _decode_thumbnail(img_data, thumbnail_size)
+        if decoded is None:
+            return None
         
-        cache_stats = self.memory_cache.get_stats()
+        img_resized, width, height = decoded
+        thumbnail = _encode_thumbnail(img_resized)
+        if not thumbnail:
+            return None
         
-        return {
-            "total_processed": len(self.metrics),
-            "successful": len(successful),
-            "failed": len(self.metrics) - len(successful),
-            "success_rate": (len(successful) / len(self.metrics) * 100) if self.metrics else 0,
-            "cached_count": sum(1 for m in self.metrics if m.is_cached),
-            "total_download_time_seconds": self.total_download_time,
-            "avg_download_time_ms": (sum(m.download_time_ms for m in successful) / len(successful)) if successful else 0,
-            "avg_processing_time_ms": avg_processing_time * 1000,
-            "avg_image_size_kb": (sum(m.size_kb for m in successful) / len(successful)) if successful else 0,
-            "memory_cache_stats": cache_stats
-        }
+        return ImageProcessingResult(
+            filepath=filepath,
+            base64_str=_b64encode_str(thumbnail),
+            image_info={
+                "width": width,
+                "height": height,
+                "file_size_kb": len(img_data) / 1024,
+                "from_cache": True
+            }
+        )
+    except Exception as e:
+        logger.debug(f"Error reading from disk cache: {e}")
+        return None
+
+
+def _decode_full(image_data: bytes) -> Optional[np.ndarray]:
+    """Полное декодирование в BGR с запасным вариантом через PIL и ограничением размера"""
+    # Декодирование через libjpeg-turbo / OpenCV
+    img_np = _decode_bgr(image_data)
+
+    if img_np is None:
+        # Попытка через PIL как запасной вариант
+        try:
+            with Image.open(BytesIO(image_data)) as img_pil:
+                if img_pil.mode == 'RGBA':
+                    # Наложение на белый фон одним проходом NumPy, сразу в порядке BGR
+                    rgba = np.asarray(img_pil, dtype=np.uint8)
+                    alpha = rgba[..., 3:].astype(np.uint16)
+                    img_np = ((rgba[..., 2::-1] * alpha + 255 * (255 - alpha)) // 255).astype(np.uint8)
+                else:
+                    # Конвертация в RGB
+                    if img_pil.mode != 'RGB':
+                        img_pil = img_pil.convert('RGB')
+                    img_np = cv2.cvtColor(np.asarray(img_pil), cv2.COLOR_RGB2BGR)
+        except Exception as e:
+            logger.debug(f"PIL decode failed: {e}")
+            return None
+
+    # Проверка валидности
+    if img_np.size == 0 or img_np.shape[0] == 0 or img_np.shape[1] == 0:
+        return None
+
+    # Масштабирование очень больших изображений
+    height, width = img_np.shape[:2]
+    if width > 5000 or height > 5000:
+        scale = min(5000 / width, 5000 / height)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        img_np = cv2.resize(img_np, (new_width, new_height), cv2.INTER_AREA)
+
+    return img_np
 
 
 def _process_image_sync_static(image_data: bytes, url_hash: str, images_dir: str, compression_params: list) -> Optional[ImageProcessingResult]:
     """Синхронная обработка изображения (выполняется в отдельном процессе)"""
     start_time = time.time()
+    thumbnail_size = (120, 120)  # Default size
 
     try:
-        # Декодирование через OpenCV
-        nparr = np.frombuffer(image_data, np.uint8)
-        img_np = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Небольшой JPEG сохраняется как есть: без полного декодирования и повторного
+        # кодирования с потерями; миниатюра - через масштабированное декодирование.
+        # Повернутый по EXIF снимок перекодируется уже повернутым
+        decoded = None
+        if (image_data[:3] == b'\xff\xd8\xff' and len(image_data) <= JPEG_PASSTHROUGH_MAX_BYTES
+                and _jpeg_orientation(image_data) == 1):
+            decoded = _decode_thumbnail(image_data, thumbnail_size)
+            if decoded is not None and max(decoded[1], decoded[2]) > JPEG_PASSTHROUGH_MAX_SIDE:
+                decoded = None
 
-        if img_np is None:
-            # Попытка через PIL как запасной вариант
-            try:
-                with Image.open(BytesIO(image_data)) as img_pil:
-                    # Конвертация в RGB
-                    if img_pil.mode in ('RGBA', 'LA', 'P'):
-                        if img_pil.mode == 'RGBA':
-                            background = Image.new('RGB', img_pil.size, (255, 255, 255))
-                            background.paste(img_pil, mask=img_pil.split()[3])
-                            img_pil = background
-                        else:
-                            img_pil = img_pil.convert('RGB')
-                    elif img_pil.mode != 'RGB':
-                        img_pil = img_pil.convert('RGB')
-
-                    img_np = np.array(img_pil)
-                    img_np = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-            except Exception as e:
-                logger.debug(f"PIL decode failed: {e}")
+        if decoded is not None:
+            img_resized, width, height = decoded
+            encoded = image_data
+        else:
+            img_np = _decode_full(image_data)
+            if img_np is None:
                 return None
 
-        # Проверка валидности
-        if img_np.size == 0 or img_np.shape[0] == 0 or img_np.shape[1] == 0:
-            return None
-
-        # Получаем размеры
-        height, width = img_np.shape[:2]
+            # Получаем размеры
+            height, width = img_np.shape[:2]
 
-        # Масштабирование очень больших изображений
-        if width > 5000 or height > 5000:
-            scale = min(5000 / width, 5000 / height)
+            # Создание миниатюры
+            scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height, 1.0)
             new_width = int(width * scale)
             new_height = int(height * scale)
-            img_np = cv2.resize(img_np, (new_width, new_height), cv2.INTER_AREA)
-            height, width = img_np.shape[:2]
 
-        # Создание миниатюры
-        thumbnail_size = (120, 120)  # Default size
-        scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height, 1.0)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
+            # Выбор интерполяции
+            interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
+            img_resized = cv2.resize(img_np, (new_width, new_height), interpolation=interpolation)
 
-        # Выбор интерполяции
-        interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
-        img_resized = cv2.resize(img_np, (new_width, new_height), interpolation=interpolation)
+            # Кодирование оригинала в память: размер известен без stat, ошибка кодирования видна
+            success, encoded = cv2.imencode('.jpg', img_np, compression_params)
+            if not success:
+                return None
 
         # Кодирование в base64
-        success, buffer = cv2.imencode('.jpg', img_resized, [
-            cv2.IMWRITE_JPEG_QUALITY, 85,
-            cv2.IMWRITE_JPEG_OPTIMIZE, 1
-        ])
+        thumbnail = _encode_thumbnail(img_resized)
 
-        if not success:
+        if not thumbnail:
             return None
 
-        base64_str = base64.b64encode(buffer.tobytes()).decode('utf-8')
+        base64_str = _b64encode_str(thumbnail)
 
-        # Сохранение оригинального изображения
+        # Сохранение оригинального изображения одной записью
         timestamp = int(time.time() * 1000)
         filename = f"photo_{url_hash}_{timestamp}.jpg"
         filepath = os.path.join(images_dir, filename)
 
-        cv2.imwrite(filepath, img_np, compression_params)
+        with open(filepath, 'wb') as f:
+            f.write(encoded)
 
-        # Получение размера файла
-        file_size_kb = os.path.getsize(filepath) / 1024
+        file_size_kb = len(encoded) / 1024
         processing_time = time.time() - start_time
 
         return ImageProcessingResult(
@@ -882,7 +1156,7 @@ def _process_image_sync_static(image_data: bytes, url_hash: str, images_dir: str
                 "file_size_kb": file_size_kb,
                 "original_size": len(image_data),
                 "processing_time": processing_time,
-                "thumbnail_size": (new_width, new_height)
+                "thumbnail_size": (img_resized.shape[1], img_resized.shape[0])
             }
         )
 
@@ -923,7 +1197,9 @@ async def process_images_batch(processor: ImageProcessorWithEmbedding,
     except:
         max_concurrent = min(len(urls), 12)
     
-    semaphore = asyncio.Semaphore(max_concurrent)
+    # Сверх лимита загрузок - места для изображений, ожидающих декодирования в пуле:
+    # сеть не простаивает, пока CPU занят, и наоборот
+    semaphore = asyncio.Semaphore(max_concurrent + processor.decode_capacity)
     
     async def process_single(url: str):
         async with semaphore:
@@ -995,27 +1271,15 @@ def create_thumbnail_from_file(file_path: str, thumbnail_size: tuple = (120, 120
         with open(file_path, 'rb') as f:
             data = f.read()
         
-        nparr = np.frombuffer(data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        decoded = _decode_thumbnail(data, thumbnail_size)
         
-        if img is None:
+        if decoded is None:
             return None
         
-        height, width = img.shape[:2]
-        scale = min(thumbnail_size[0] / width, thumbnail_size[1] / height, 1.0)
-        
-        if scale < 1:
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            img = cv2.resize(img, (new_width, new_height), cv2.INTER_AREA)
-        
-        success, buffer = cv2.imencode('.jpg', img, [
-            cv2.IMWRITE_JPEG_QUALITY, 85,
-            cv2.IMWRITE_JPEG_OPTIMIZE, 1
-        ])
+        thumbnail = _encode_thumbnail(decoded[0])
         
-        if success:
-            return base64.b64encode(buffer).decode('utf-8')
+        if thumbnail:
+            return _b64encode_str(thumbnail)
         
         return None
         
@@ -5,28 +5,88 @@
 import os
 import sys
 import glob
+import asyncio
+import functools
+import importlib.util
 import psutil
 import platform
 import shutil
+import stat
 import json
 import time
 from typing import Tuple, Dict, List, Optional, Any
 from core.config import Config
 
-def ensure_directories():
-    """Создание необходимых директорий"""
-    Config.ensure_base_directories()
+# ОС не меняется за время работы - определяем один раз
+_IS_WIN = platform.system() == "Windows"
+
+def _scan_parent(parent: str, names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Один scandir родительской папки вместо stat на каждый путь"""
+    found = {}
+    try:
+        with os.scandir(parent) as entries:
+            for entry in entries:
+                if entry.name in names:
+                    try:
+                        found[entry.name] = {
+                            'exists': True,
+                            'is_dir': entry.is_dir(),
+                            'mtime': entry.stat().st_mtime
+                        }
+                    except OSError:
+                        continue
+    except OSError:
+        pass
+    
+    return {
+        os.path.join(parent, name): found.get(name, {'exists': False, 'is_dir': False, 'mtime': None})
+        for name in names
+    }
+
+async def preflight(paths: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Манифест {path: {exists, is_dir, mtime}}: пути группируются по родителю, по scandir на родителя"""
+    by_parent: Dict[str, List[str]] = {}
+    for path in paths:
+        parent, name = os.path.split(os.path.abspath(path))
+        by_parent.setdefault(parent, []).append(name)
+    
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(None, _scan_parent, parent, names)
+        for parent, names in by_parent.items()
+    ))
+    
+    scanned = {}
+    for result in results:
+        scanned.update(result)
+    return {path: scanned[os.path.abspath(path)] for path in paths}
+
+async def ensure_directories(manifest: Optional[Dict[str, Dict[str, Any]]] = None):
+    """Создание необходимых директорий (параллельно, в пуле потоков)"""
+    folders = Config.get_base_directories()
+    if manifest is None:
+        manifest = await preflight(folders)
+    
+    # Создаем только отсутствующие по манифесту папки;
+    # на сетевых дисках время ограничено самой медленной папкой, а не суммой
+    missing_dirs = [folder for folder in folders if not manifest[folder]['is_dir']]
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(None, functools.partial(os.makedirs, folder, exist_ok=True))
+        for folder in missing_dirs
+    ))
     print(f"📁 Папка для входных данных: {Config.get_input_dir()}")
     print(f"📁 Папка для результатов: {Config.get_output_dir()}")
     print()
 
 def print_banner():
     """Вывод баннера с информацией о системе"""
-    # Очистка экрана
-    if platform.system() == "Windows":
+    # Очистка экрана: на Unix - ANSI-последовательностью в той же записи, без запуска оболочки
+    clear_screen = ""
+    if _IS_WIN:
         os.system('cls')
-    else:
-        os.system('clear')
+    elif sys.stdout.isatty():
+        clear_screen = "\033[2J\033[H"
     
     banner = f"""
     ============================================================
@@ -39,7 +99,8 @@ def print_banner():
     ============================================================
 """
 
-    print(banner)
+    sys.stdout.write(clear_screen + banner + "\n")
+    sys.stdout.flush()
 
 def select_file() -> str:
     """Выбор файла для обработки с детальной информацией"""
@@ -393,18 +454,26 @@ def get_optional_dependencies() -> Dict[str, tuple]:
         'openpyxl': ('Excel', 'pip install openpyxl'),
     }
 
+# Имя модуля для импорта, если оно отличается от имени пакета pip
+_IMPORT_NAMES = {
+    'Pillow': 'PIL',
+    'opencv-python': 'cv2',
+}
+
+@functools.lru_cache(maxsize=None)
+def _have_module(lib: str) -> bool:
+    """Доступен ли пакет (find_spec без импорта, результат кэшируется на процесс)"""
+    try:
+        return importlib.util.find_spec(_IMPORT_NAMES.get(lib, lib)) is not None
+    except (ImportError, ValueError):
+        return False
+
 def check_required_dependencies(required_deps: Dict[str, str], missing: list) -> list:
     """Проверить обязательные зависимости"""
     for lib, cmd in required_deps.items():
-        try:
-            if lib == 'Pillow':
-                __import__('PIL.Image')
-            elif lib == 'opencv-python':
-                __import__('cv2')
-            else:
-                __import__(lib)
+        if _have_module(lib):
             print(f"   ✅ {lib}")
-        except ImportError:
+        else:
             print(f"   ❌ {lib}")
             missing.append(cmd)
     
@@ -414,10 +483,9 @@ def check_optional_dependencies(optional_deps: Dict[str, tuple], selected_format
     """Проверить опциональные зависимости"""
     for lib, (format_name, cmd) in optional_deps.items():
         if format_name in selected_formats:
-            try:
-                __import__(lib)
+            if _have_module(lib):
                 print(f"   ✅ {lib} (для {format_name})")
-            except ImportError:
+            else:
                 print(f"   ❌ {lib} (для {format_name})")
                 optional_missing.append((format_name, cmd))
         else:
@@ -433,7 +501,7 @@ def handle_missing_dependencies(missing: list) -> bool:
         print(f"   {cmd}")
     
     # Предлагаем установить автоматически
-    if platform.system() == "Windows":
+    if _IS_WIN:
         return offer_automatic_installation(missing)
     
     return False
@@ -447,18 +515,13 @@ def offer_automatic_installation(missing: list) -> bool:
             print(f"Устанавливаю: {cmd}")
             os.system(cmd)
         
-        # Повторная проверка
+        # Повторная проверка: после установки кэш поиска модулей устарел
         print("\nПовторная проверка...")
+        _have_module.cache_clear()
+        importlib.invalidate_caches()
         required_deps = get_required_dependencies()
         for lib, cmd in required_deps.items():
-            try:
-                if lib == 'Pillow':
-                    __import__('PIL.Image')
-                elif lib == 'opencv-python':
-                    __import__('cv2')
-                else:
-                    __import__(lib)
-            except ImportError:
+            if not _have_module(lib):
                 print(f"Не удалось установить {lib}. Установите вручную.")
                 return False
         
@@ -485,10 +548,24 @@ def handle_optional_dependencies(optional_missing: list, selected_formats: list)
     
     return True
 
+# Число ядер не меняется за время работы - запрашиваем один раз
+_LOGICAL_CPUS = psutil.cpu_count(logical=True)
+
+def available_cpus() -> int:
+    """Число CPU, доступных процессу (с учетом привязки к ядрам в контейнерах и taskset)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return _LOGICAL_CPUS or 1
+
+@functools.lru_cache(maxsize=1)
+def _virtual_memory(bucket: int):
+    """Снимок памяти на секундный интервал bucket (повторные вызовы не читают /proc/meminfo)"""
+    return psutil.virtual_memory()
+
 def get_available_memory_info() -> Dict[str, float]:
-    """Получить информацию о доступной памяти"""
+    """Получить информацию о доступной памяти (данные могут отставать до 1 секунды)"""
     try:
-        memory = psutil.virtual_memory()
+        memory = _virtual_memory(int(time.monotonic()))
         return {
             'total_gb': memory.total / 1024**3,
             'available_gb': memory.available / 1024**3,
@@ -553,8 +630,8 @@ def check_system_resources() -> bool:
     
     # CPU
     try:
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_cores = psutil.cpu_count()
+        cpu_percent = psutil.cpu_percent(interval=None)
+        cpu_cores = _LOGICAL_CPUS
         print(f"   CPU: {cpu_cores} ядер, нагрузка: {cpu_percent:.1f}%")
         
         if cpu_percent > 90:
@@ -621,46 +698,66 @@ def cleanup_old_results(max_age_days: int = 7):
     if not os.path.exists(output_dir):
         return
     
-    current_time = time.time()
+    cutoff = time.time() - max_age_days * 24 * 3600
     
-    for item in os.listdir(output_dir):
-        item_path = os.path.join(output_dir, item)
-        if os.path.isdir(item_path) and item.startswith("results_"):
+    # Один проход scandir: тип и время изменения берутся из DirEntry
+    with os.scandir(output_dir) as entries:
+        old_dirs = []
+        for entry in entries:
+            if not entry.name.startswith("results_"):
+                continue
             try:
-                item_age = current_time - os.path.getmtime(item_path)
-                if item_age > max_age_days * 24 * 3600:
-                    size_mb = get_directory_size(item_path) / 1024**2
-                    
-                    confirm = get_user_confirmation(
-                        f"Найдена старая папка результатов: {item} ({size_mb:.1f} MB). Удалить?",
-                        default='n'
-                    )
-                    
-                    if confirm:
-                        shutil.rmtree(item_path)
-                        print(f"✅ Удалено: {item}")
-            except Exception as e:
-                print(f"⚠️  Ошибка при проверке {item}: {e}")
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    old_dirs.append(entry)
+            except OSError as e:
+                print(f"⚠️  Ошибка при проверке {entry.name}: {e}")
+    
+    for entry in old_dirs:
+        try:
+            size_mb = get_directory_size(entry.path) / 1024**2
+            
+            confirm = get_user_confirmation(
+                f"Найдена старая папка результатов: {entry.name} ({size_mb:.1f} MB). Удалить?",
+                default='n'
+            )
+            
+            if confirm:
+                shutil.rmtree(entry.path)
+                print(f"✅ Удалено: {entry.name}")
+        except Exception as e:
+            print(f"⚠️  Ошибка при проверке {entry.name}: {e}")
 
 def get_directory_size(directory: str) -> int:
     """Получить размер директории в байтах"""
     total_size = 0
-    for dirpath, dirnames, filenames in os.walk(directory):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            if os.path.exists(fp):
-                total_size += os.path.getsize(fp)
+    stack = [directory]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            total_size += entry.stat().st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
     return total_size
 
-def validate_file_path(file_path: str) -> Tuple[bool, str]:
-    """Проверить валидность пути к файлу"""
-    if not os.path.exists(file_path):
-        return False, "Файл не существует"
+def validate_file_path(file_path: str, st: Optional[os.stat_result] = None) -> Tuple[bool, str]:
+    """Проверить валидность пути к файлу (st - уже полученный os.stat, чтобы не повторять вызов)"""
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False, "Файл не существует"
     
-    if not os.path.isfile(file_path):
+    if not stat.S_ISREG(st.st_mode):
         return False, "Указанный путь не является файлом"
     
-    if os.path.getsize(file_path) == 0:
+    if st.st_size == 0:
         return False, "Файл пуст"
     
     # Проверяем расширение файла
@@ -3,55 +3,134 @@ Logging system configuration
 """
 
 import os
+import queue
+import atexit
 import logging
+import logging.config
+import logging.handlers
 import platform
 
-def setup_logging():
-    """Setup logging system"""
-    # Clear existing handlers
-    for handler in logging.root.handlers[:]:
-        logging.root.removeHandler(handler)
+LOGGER_NAME = "FaceRecognitionProcessor"
+
+# Configuration state lives on the logger object itself, not in module globals: if this
+# module is imported under a second name (utils.logger / src.utils.logger), both copies
+# see the same configured logger and neither reconfigures it
+
+
+def _stop_listener():
+    """Drain queued records into the handlers and stop the listener thread"""
+    logger = logging.getLogger(LOGGER_NAME)
+    listener = getattr(logger, 'queue_listener', None)
+    if listener is not None:
+        listener.stop()
+        logger.queue_listener = None
+
+
+def _apply_level(logger: logging.Logger, level: str):
+    """Change levels of an already configured logger without reopening its handlers"""
+    level_no = logging.getLevelName(level)
+    logger.setLevel(level_no)
+    for handler in logger.queue_listener.handlers:
+        if isinstance(handler, logging.FileHandler):
+            handler.setLevel(level_no)
+        else:
+            # Console never shows DEBUG
+            handler.setLevel(max(level_no, logging.INFO))
+    logger.configured_level = level
+
+
+class ColorFormatter(logging.Formatter):
+    COLORS = {
+        'INFO': '\033[92m',
+        'WARNING': '\033[93m',
+        'ERROR': '\033[91m',
+        'CRITICAL': '\033[41m',
+        'RESET': '\033[0m'
+    }
     
-    logger = logging.getLogger("FaceRecognitionProcessor")
-    logger.setLevel(logging.INFO)
+    def format(self, record):
+        msg = super().format(record)
+        if platform.system() == "Windows":
+            try:
+                os.system('')
+                color = self.COLORS.get(record.levelname, self.COLORS['RESET'])
+                return f"{color}{msg}{self.COLORS['RESET']}"
+            except:
+                return msg
+        return msg
+
+
+def setup_logging(level: str = None):
+    """Setup logging system once; later calls return the configured logger
     
-    # Clear existing handlers from logger
-    logger.handlers.clear()
+    An explicit level on a configured logger only changes handler levels: the log
+    file is not reopened (mode 'w' would drop what the run has already logged).
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if getattr(logger, 'queue_listener', None) is not None:
+        if level is not None and level != logger.configured_level:
+            _apply_level(logger, level)
+        return logger
     
-    class ColorFormatter(logging.Formatter):
-        COLORS = {
-            'INFO': '\033[92m',
-            'WARNING': '\033[93m',
-            'ERROR': '\033[91m',
-            'CRITICAL': '\033[41m',
-            'RESET': '\033[0m'
-        }
-        
-        def format(self, record):
-            msg = super().format(record)
-            if platform.system() == "Windows":
-                try:
-                    os.system('')
-                    color = self.COLORS.get(record.levelname, self.COLORS['RESET'])
-                    return f"{color}{msg}{self.COLORS['RESET']}"
-                except:
-                    return msg
-            return msg
+    if level is None:
+        level = "INFO"
     
-    console = logging.StreamHandler()
-    console.setFormatter(ColorFormatter('%(asctime)s - %(levelname)s - %(message)s', '%H:%M:%S'))
-    console.setLevel(logging.INFO)
+    # Console never shows DEBUG; the file gets everything down to the chosen level
+    console_level = max(logging.getLevelName(level), logging.INFO)
     
-    file_handler = logging.FileHandler("processing.log", encoding='utf-8', mode='w')
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    ))
+    logging.config.dictConfig({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'color': {
+                '()': ColorFormatter,
+                'fmt': '%(asctime)s - %(levelname)s - %(message)s',
+                'datefmt': '%H:%M:%S'
+            },
+            'file': {
+                'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                'datefmt': '%Y-%m-%d %H:%M:%S'
+            }
+        },
+        'handlers': {
+            'console': {
+                'class': 'logging.StreamHandler',
+                'formatter': 'color',
+                'level': console_level
+            },
+            'file': {
+                'class': 'logging.FileHandler',
+                'formatter': 'file',
+                'filename': 'processing.log',
+                'encoding': 'utf-8',
+                'mode': 'w',
+                'level': level
+            }
+        },
+        'loggers': {
+            LOGGER_NAME: {
+                'level': level,
+                'handlers': ['console', 'file']
+            }
+        },
+        # Clear existing root handlers
+        'root': {
+            'handlers': []
+        }
+    })
     
-    logger.addHandler(console)
-    logger.addHandler(file_handler)
+    # Move the configured handlers behind a queue: logging calls (including logger.exception
+    # on error paths) do not wait for console and file writes
+    handlers = logger.handlers[:]
+    log_queue = queue.Queue(-1)
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.queue_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    logger.queue_listener.start()
+    logger.configured_level = level
     
     return logger
 
+atexit.register(_stop_listener)
+
 # Alias function to match expected import
-setup_logger = setup_logging
\ No newline at end of file
+setup_logger = setup_logging